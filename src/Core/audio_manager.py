@@ -1,6 +1,7 @@
 import os
 import time
 import logging
+import threading
 import tempfile
 import numpy as np
 import pygame
@@ -25,7 +26,7 @@ class AudioManager:
         # sound = pygame.sndarray.make_sound(stereo_beep)
         # sound.play()
 
-    def recognize_speech(self):
+    def recognize_speech(self, on_partial_transcript=None):
         if pygame.mixer.get_init():
             pygame.mixer.music.stop()
         
@@ -40,6 +41,11 @@ class AudioManager:
                 audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
             
             logging.info("Audio captured, attempting to transcribe...")
+
+            if on_partial_transcript and PREFETCH_SETTINGS["voice_draft_transcript"]:
+                # A quick draft transcript lets retrieval start while Whisper is still working
+                threading.Thread(target=self.draft_transcript, args=(recognizer, audio, on_partial_transcript),
+                                 daemon=True).start()
             
             with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
                 temp_audio.write(audio.get_wav_data())
@@ -69,6 +75,12 @@ class AudioManager:
                 except FileNotFoundError:
                     logging.warning(f"Could not delete temporary file: {temp_audio_path}")
 
+    def draft_transcript(self, recognizer, audio, on_partial_transcript):
+        try:
+            on_partial_transcript(recognizer.recognize_google(audio))
+        except Exception as e:
+            logging.debug(f"Draft transcript unavailable: {e}")
+
     def text_to_speech(self, text):
         response = self.client.audio.speech.create(
             model=TTS_SETTINGS["model"],
@@ -0,0 +1,105 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+BM25_FILENAME = "bm25_index.sqlite3"
+
+# Keeps part numbers, command names and dotted identifiers (e.g. "abc-123", "os.path") whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9_](?:[a-z0-9_.\-]*[a-z0-9_])?")
+
+
+def tokenize(text):
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        # Also index the parts of compound tokens so "abc" still finds "abc-123"
+        if "-" in token or "." in token:
+            terms.extend(part for part in re.split(r"[.\-]", token) if part)
+    return terms
+
+
+class BM25Index:
+    def __init__(self, db_path, k1=1.5, b=0.75):
+        self.path = os.path.join(db_path, BM25_FILENAME)
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, length INTEGER NOT NULL)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, doc_id)"
+                ") WITHOUT ROWID"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc_id)")
+            self.conn.commit()
+        return self.conn
+
+    def add(self, ids, texts):
+        with self.lock:
+            conn = self.connect()
+            self._delete(conn, ids)
+            doc_rows = []
+            posting_rows = []
+            for id_, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                doc_rows.append((id_, sum(counts.values())))
+                posting_rows.extend((term, id_, tf) for term, tf in counts.items())
+            conn.executemany("INSERT INTO docs (id, length) VALUES (?, ?)", doc_rows)
+            conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", posting_rows)
+            conn.commit()
+
+    def delete(self, ids):
+        if not ids or not self.exists():
+            return
+        with self.lock:
+            conn = self.connect()
+            self._delete(conn, ids)
+            conn.commit()
+
+    def _delete(self, conn, ids):
+        rows = [(id_,) for id_ in ids]
+        conn.executemany("DELETE FROM postings WHERE doc_id = ?", rows)
+        conn.executemany("DELETE FROM docs WHERE id = ?", rows)
+
+    def search(self, query, k=25):
+        # Returns [(doc_id, score), ...], best first
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.exists():
+            return []
+        with self.lock:
+            conn = self.connect()
+            doc_count, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            if not doc_count:
+                return []
+            average_length = total_length / doc_count
+            scores = Counter()
+            for term in terms:
+                postings = conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf, length in postings:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+        return scores.most_common(k)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
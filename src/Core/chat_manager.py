@@ -1,13 +1,21 @@
 import threading
-from interpreter import interpreter
+import uuid
+from datetime import datetime
 from Core.command_manager import CommandExecutor
 from Core.context_manager import ContextManager
+from Core.context_packer import ContextPacker
+from Core.retrieval_prefetcher import RetrievalPrefetcher
+from Core.skill_index import SkillIndex
+from Core.conversation_compactor import ConversationCompactor
+from Core.history_store import get_history_store
 from Settings.config import *
 
 
 class ChatManager:
-  def __init__(self, interpreter_manager, chat_ui):  # Added chat_ui parameter
+  def __init__(self, interpreter_manager, chat_ui, skill_index=None):
+    # chat_ui is the ChatUI or a headless ChatSession; both carry the conversation's settings
     self.interpreter_manager = interpreter_manager
+    self.interpreter = interpreter_manager.interpreter
     self.knowledge_manager = chat_ui.knowledge_manager  # Access KnowledgeManager instance
     # If InterpreterManager needs KnowledgeManager, set it here
     self.interpreter_manager.knowledge_manager = self.knowledge_manager
@@ -20,10 +28,37 @@ class ChatManager:
     self.listen_thread = None
     self.context_manager = ContextManager(chat_ui)
     self.command_executor = CommandExecutor()
+    self.context_packer = ContextPacker(CONTEXT_PACKING_SETTINGS["budget_tokens"])
+    self.prefetcher = RetrievalPrefetcher(
+      self.context_manager,
+      debounce_seconds=PREFETCH_SETTINGS["debounce_seconds"],
+      similarity_threshold=PREFETCH_SETTINGS["similarity_threshold"],
+      min_chars=PREFETCH_SETTINGS["min_chars"],
+      wait_seconds=PREFETCH_SETTINGS["wait_seconds"],
+      enabled=PREFETCH_SETTINGS["enabled"]
+    )
+    # Sessions share one index so each skill is embedded once per process
+    self.skill_index = skill_index or SkillIndex(
+      self.context_manager.embedding_function,
+      top_k=SKILL_SETTINGS["top_k"],
+      min_similarity=SKILL_SETTINGS["min_similarity"],
+      max_skill_tokens=SKILL_SETTINGS["max_skill_tokens"]
+    )
+    self.compactor = ConversationCompactor(
+      CONVERSATION_COMPACTION_SETTINGS["threshold_tokens"],
+      CONVERSATION_COMPACTION_SETTINGS["keep_recent_tokens"],
+      CONVERSATION_COMPACTION_SETTINGS["summary_model"],
+      summary_max_tokens=CONVERSATION_COMPACTION_SETTINGS["summary_max_tokens"],
+      enabled=CONVERSATION_COMPACTION_SETTINGS["enabled"]
+    )
+    self.history_store = get_history_store()
+    self.conversation_id = self.new_conversation_id()
 
   def update_selected_kbs(self, selected_kbs):
     self.selected_kbs = selected_kbs
     self.interpreter_manager.update_system_message(selected_kbs)
+    # Embed the newly available skills before the first query needs them
+    self.skill_index.warm(self.knowledge_manager.get_available_skills(selected_kbs))
 
   def update_wake_word(self, wake_word):
     self.wake_word = wake_word
@@ -34,38 +69,62 @@ class ChatManager:
   def update_env_vars(self, env_vars):
     self.env_vars = env_vars
 
-  def process_input(self, user_input, selected_kbs):
+  def process_input(self, user_input, selected_kbs, cancel_event=None):
+      # Swap in a finished compaction of the history while the interpreter is idle
+      self.compactor.prepare(self.interpreter)
+      turn_start = len(self.interpreter.messages)
+
       # Check for command first
       command_response = self.command_executor.execute_command(user_input)
       if command_response is not None:
+          self.prefetcher.cancel()
           response_generator = self.get_interpreter_response(context=None, query=command_response)
-          return response_generator, []
+          return self.finish_turn(response_generator, user_input, turn_start, cancel_event), []
 
       # Query the database if no command is found
       if selected_kbs:
           print(f"Querying selected knowledge bases: {selected_kbs}")
-          context_text, sources = self.context_manager.query_vector_database(user_input, selected_kbs)
+          # Reuse retrieval started while the user was still typing or speaking, if it matches
+          prefetched = self.prefetcher.take(user_input, selected_kbs)
+          if prefetched is not None:
+              context_docs, sources = prefetched
+          else:
+              context_docs, sources = self.context_manager.query_vector_database(user_input, selected_kbs)
       else:
-          context_text, sources = None, []
+          context_docs, sources = None, []
+
+      # Preempted while retrieving: don't start an LLM call nobody will read
+      if cancel_event is not None and cancel_event.is_set():
+          return iter(()), sources
 
-      response_generator = self.get_interpreter_response(context_text, user_input)
+      response_generator = self.get_interpreter_response(context_docs, user_input)
 
-      return response_generator, sources
+      return self.finish_turn(response_generator, user_input, turn_start, cancel_event), sources
 
   def get_interpreter_response(self, context, query):
-    available_skills = self.knowledge_manager.get_available_skills()
-    if available_skills:
-      # Extract skill names and paths from the tuples
-      skill_info = [f"{name} (Path: {path})\n" for name, path in available_skills]
-      #available_skills_str = ", ".join(skill_info)
+    # Fit retrieved chunks and skills into the token budget, in that order. KB instructions live in the
+    # system message. Only the skills relevant to this query are included, inline when they fit, so the
+    # model doesn't spend a turn opening the file
+    self.interpreter_manager.update_instructions(self.selected_kbs)
+    available_skills = self.knowledge_manager.get_available_skills(self.selected_kbs)
+    packed = self.context_packer.pack(
+      [],
+      context or [],
+      self.skill_index.prompt_candidates(available_skills, query)
+    )
+    print(f"Packed context: {packed.usage} tokens used, dropped {packed.dropped}")
+    if packed.skills:
+      skill_info = "\n".join(packed.skills)
       base_prompt = f"""
-Available skills: {skill_info}
+Relevant skills:
+{skill_info}
 
 Instructions:
 1. Analyze the query carefully.
-2. If any available skills are relevant, read the contents of the skill file at the provided path to see if it can help you.
-3. If no skills are relevant or if the query is simple, respond naturally without mentioning or using skills.
-4. Always prioritize giving a helpful and appropriate response over using skills unnecessarily.
+2. If a skill above is relevant and its steps are included, follow them strictly; there is no need to open the skill file.
+3. If a relevant skill is only listed by path, read the contents of the skill file at that path.
+4. If no skills are relevant or if the query is simple, respond naturally without mentioning or using skills.
+5. Always prioritize giving a helpful and appropriate response over using skills unnecessarily.
 
 Query: {query}
 """
@@ -73,14 +132,45 @@ Query: {query}
         base_prompt = f"""
         {query}
         """
-    if context is not None:
+    if packed.chunks:
         context_prompt = f"""
         Consider the following context when formulating your response:
-        {context}
+        {packed.context_text}
         """
         prompt = context_prompt + "\n" + base_prompt
     else:
         prompt = base_prompt
     
     print(prompt)
-    return interpreter.chat(prompt, display=False, stream=True)
+    return self.interpreter.chat(prompt, display=False, stream=True)
+
+  def finish_turn(self, response_generator, user_input, turn_start, cancel_event=None):
+    cancelled = False
+    try:
+      for chunk in response_generator:
+        # Checked between chunks; closing the generator stops the LLM stream where it is
+        if cancel_event is not None and cancel_event.is_set():
+          cancelled = True
+          break
+        yield chunk
+    finally:
+      response_generator.close()
+      if cancelled:
+        self.stop_running_code()
+        print(f"Turn cancelled: {user_input[:60]}")
+      # Queued for the history store's background writer, including the part of a cancelled turn
+      self.history_store.record_turn(self.conversation_id, user_input, self.interpreter.messages[turn_start:])
+      # Summarize older turns in the background once the history passes the threshold
+      self.compactor.schedule(self.interpreter.messages)
+
+  def stop_running_code(self):
+    # Stops code the model started so the next turn doesn't share the interpreter with it; also called
+    # from the thread that cancels a turn, since a running command yields no chunk to notice the cancel by
+    self.interpreter.computer.terminate()
+
+  def new_conversation_id(self):
+    return f"{datetime.now().strftime('%Y_%m_%d_%H-%M-%S')}_{uuid.uuid4().hex[:8]}"
+
+  def reset_conversation(self):
+    self.compactor.discard()
+    self.conversation_id = self.new_conversation_id()
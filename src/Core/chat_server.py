@@ -0,0 +1,371 @@
+import asyncio
+import hmac
+import json
+import threading
+import time
+from aiohttp import WSMsgType, web
+from Settings.config import REQUEST_SCHEDULER_SETTINGS, SERVER_SETTINGS, SESSION_POOL_SETTINGS
+from Core.embedding_cache import get_embedding_function
+from Core.kb_registry import kb_registry
+from Core.request_scheduler import RequestScheduler
+from Core.semantic_cache import semantic_cache
+from Core.session_pool import SessionPool, SessionPoolFull
+
+# The parts of an interpreter chunk a client needs to render it
+CHUNK_FIELDS = ("role", "type", "format", "content", "start", "end")
+
+
+def chunk_event(chunk):
+    event = {"event": "chunk"}
+    event.update({field: chunk[field] for field in CHUNK_FIELDS if field in chunk})
+    return event
+
+
+def prometheus_lines(prefix, values):
+    # Flattens nested numeric stats into Prometheus text exposition lines
+    lines = []
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            lines.extend(prometheus_lines(name, value))
+        elif isinstance(value, bool):
+            lines.append(f"{name} {int(value)}")
+        elif isinstance(value, (int, float)):
+            lines.append(f"{name} {value}")
+    return lines
+
+
+class TurnStream:
+    # Carries one turn's events from the scheduler's worker thread to the event loop. At most max_buffered
+    # chunks can be unread, so a slow client slows the worker (and the LLM stream behind it) down instead
+    # of the server buffering without limit
+    def __init__(self, loop, max_buffered):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.slots = threading.Semaphore(max_buffered)
+
+    def put(self, request, event):
+        # Worker thread: waits for a free slot, giving up once the turn is cancelled
+        while not self.slots.acquire(timeout=0.5):
+            if request.cancelled:
+                return False
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        return True
+
+    def close(self, event):
+        # Any thread; the final event never waits for a slot
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            pass  # The event loop has already shut down
+
+    async def events(self):
+        while True:
+            event = await self.queue.get()
+            if event["event"] == "done":
+                yield event
+                return
+            self.slots.release()
+            yield event
+
+
+class ChatServer:
+    # HTTP and WebSocket API over the same pipeline as the Tk UI: each session is a pooled ChatSession,
+    # and its turns go through the request scheduler, so they queue, preempt and cancel the same way
+    def __init__(self, knowledge_manager, template=None, default_kbs=None, api_token=None, max_buffered_chunks=None):
+        self.scheduler = RequestScheduler(
+            self.run_turn,
+            max_queue=REQUEST_SCHEDULER_SETTINGS["max_queue"],
+            preempt=REQUEST_SCHEDULER_SETTINGS["preempt"]
+        )
+        self.pool = SessionPool(
+            knowledge_manager,
+            template,
+            max_sessions=SESSION_POOL_SETTINGS["max_sessions"],
+            idle_timeout=SESSION_POOL_SETTINGS["idle_timeout"],
+            reap_interval=SESSION_POOL_SETTINGS["reap_interval"],
+            on_close=self.scheduler.forget,
+            has_pending_turns=self.scheduler.has_pending
+        )
+        self.default_kbs = list(SERVER_SETTINGS["default_kbs"] if default_kbs is None else default_kbs)
+        self.api_token = api_token if api_token is not None else SERVER_SETTINGS["api_token"]
+        self.max_buffered_chunks = max_buffered_chunks or SERVER_SETTINGS["max_buffered_chunks"]
+        self.started_at = time.monotonic()
+        self.counters = {"http_turns": 0, "websocket_turns": 0, "chunks_streamed": 0, "open_streams": 0,
+                         "open_websockets": 0, "disconnects": 0}
+        self.counters_lock = threading.Lock()  # Updated from the event loop and the scheduler's worker threads
+
+    def create_app(self):
+        app = web.Application(middlewares=[self.auth_middleware])
+        app.add_routes([
+            web.get('/health', self.health),
+            web.get('/metrics', self.metrics),
+            web.get('/knowledge_bases', self.list_knowledge_bases),
+            web.get('/sessions', self.list_sessions),
+            web.post('/sessions', self.create_session),
+            web.get('/sessions/{session_id}', self.get_session),
+            web.delete('/sessions/{session_id}', self.close_session),
+            web.put('/sessions/{session_id}/knowledge_bases', self.update_knowledge_bases),
+            web.post('/sessions/{session_id}/messages', self.post_message),
+            web.post('/sessions/{session_id}/cancel', self.cancel_turn),
+            web.post('/sessions/{session_id}/reset', self.reset_session),
+            web.get('/sessions/{session_id}/ws', self.websocket),
+        ])
+        app.on_cleanup.append(self.shutdown)
+        return app
+
+    @web.middleware
+    async def auth_middleware(self, request, handler):
+        if self.api_token and request.path != '/health':
+            header = request.headers.get('Authorization', '')
+            # Browsers can't set headers on WebSocket connections, so the token may also come as a parameter
+            token = header[len('Bearer '):] if header.startswith('Bearer ') else request.query.get('token', '')
+            if not hmac.compare_digest(token.encode('utf-8'), self.api_token.encode('utf-8')):
+                return web.json_response({"error": "unauthorized"}, status=401)
+        return await handler(request)
+
+    async def shutdown(self, app):
+        self.scheduler.cancel(reason="shutdown")
+        self.pool.shutdown()
+
+    # Turns, on the scheduler's worker threads
+
+    def run_turn(self, request):
+        session = self.pool.get(request.session_id)
+        if session is None:
+            raise LookupError(f"Session {request.session_id} was closed")
+        stream = request.sink
+        request.add_cancel_callback(lambda request: session.chat_manager.stop_running_code())
+        response_generator, sources = session.process_input(request.user_input, request.cancel_event)
+        try:
+            for chunk in response_generator:
+                if not isinstance(chunk, dict):
+                    continue
+                if not stream.put(request, chunk_event(chunk)):
+                    break
+                self.count("chunks_streamed")
+        finally:
+            response_generator.close()
+        request.result = {"response": None if request.cancelled else session.final_response(), "sources": sources}
+
+    def turn_finished(self, request):
+        event = {"event": "done", "request_id": request.id, "status": request.status,
+                 "wait_seconds": round(request.wait_seconds, 3)}
+        if request.cancel_reason:
+            event["reason"] = request.cancel_reason
+        if request.error is not None:
+            event["error"] = str(request.error)
+        if request.result:
+            event.update(request.result)
+        request.sink.close(event)
+
+    def start_turn(self, session, message, preempt=None):
+        stream = TurnStream(asyncio.get_running_loop(), self.max_buffered_chunks)
+        request = self.scheduler.submit(session.id, message, preempt=preempt, sink=stream)
+        request.add_done_callback(self.turn_finished)
+        return request, stream
+
+    # Helpers
+
+    def count(self, name, delta=1):
+        with self.counters_lock:
+            self.counters[name] += delta
+
+    def counter_values(self):
+        with self.counters_lock:
+            return dict(self.counters)
+
+    async def read_json(self, request):
+        if not request.can_read_body:
+            return {}
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(text=json.dumps({"error": "invalid JSON"}), content_type='application/json')
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text=json.dumps({"error": "expected a JSON object"}),
+                                     content_type='application/json')
+        return body
+
+    def require_session(self, request):
+        session = self.pool.get(request.match_info['session_id'])
+        if session is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "unknown session"}), content_type='application/json')
+        return session
+
+    def validate_kbs(self, selected_kbs):
+        if not isinstance(selected_kbs, list):
+            raise web.HTTPBadRequest(text=json.dumps({"error": "selected_kbs must be a list"}),
+                                     content_type='application/json')
+        unknown = [kb for kb in selected_kbs if kb not in kb_registry.knowledge_bases()]
+        if unknown:
+            raise web.HTTPBadRequest(text=json.dumps({"error": f"unknown knowledge bases: {unknown}"}),
+                                     content_type='application/json')
+        return selected_kbs
+
+    # Endpoints
+
+    async def health(self, request):
+        return web.json_response({
+            "status": "ok",
+            "uptime_seconds": round(time.monotonic() - self.started_at, 1),
+            "sessions": self.pool.stats()["sessions"],
+        })
+
+    async def metrics(self, request):
+        metrics = {
+            "server": dict(self.counter_values(), uptime_seconds=round(time.monotonic() - self.started_at, 1)),
+            "scheduler": self.scheduler.stats(),
+            "sessions": self.pool.stats(),
+            "semantic_cache": semantic_cache.stats(),
+            "embedding_cache": get_embedding_function().cache.stats(),
+        }
+        if request.query.get('format') == 'prometheus':
+            return web.Response(text="\n".join(prometheus_lines("humanscript", metrics)) + "\n",
+                                content_type='text/plain')
+        return web.json_response(metrics)
+
+    async def list_knowledge_bases(self, request):
+        knowledge_bases = []
+        for kb in kb_registry.knowledge_bases():
+            info = kb_registry.get(kb)
+            knowledge_bases.append({"name": kb, "indexed": info.indexed, "doc_count": info.doc_count,
+                                    "chunk_count": info.chunk_count, "skills": len(info.skills)})
+        return web.json_response(knowledge_bases)
+
+    async def list_sessions(self, request):
+        return web.json_response(self.pool.list_sessions())
+
+    async def create_session(self, request):
+        body = await self.read_json(request)
+        selected_kbs = self.validate_kbs(body.get("selected_kbs", self.default_kbs))
+        loop = asyncio.get_running_loop()
+        try:
+            # Building an interpreter takes a while, so it happens off the event loop
+            session = await loop.run_in_executor(None, self.pool.create, body.get("session_id"), selected_kbs)
+        except SessionPoolFull as e:
+            return web.json_response({"error": str(e)}, status=503)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=409)
+        return web.json_response(session.info(), status=201)
+
+    async def get_session(self, request):
+        return web.json_response(self.require_session(request).info())
+
+    async def close_session(self, request):
+        session = self.require_session(request)
+        await asyncio.get_running_loop().run_in_executor(None, self.pool.close, session.id)
+        return web.json_response({"closed": session.id})
+
+    async def update_knowledge_bases(self, request):
+        session = self.require_session(request)
+        body = await self.read_json(request)
+        selected_kbs = self.validate_kbs(body.get("selected_kbs", []))
+        await asyncio.get_running_loop().run_in_executor(None, session.update_selected_kbs, selected_kbs)
+        return web.json_response(session.info())
+
+    async def cancel_turn(self, request):
+        session = self.require_session(request)
+        self.scheduler.cancel(session.id, reason="stopped")
+        return web.json_response(self.scheduler.stats())
+
+    async def reset_session(self, request):
+        session = self.require_session(request)
+        loop = asyncio.get_running_loop()
+        reset = loop.create_future()
+
+        def reset_now():
+            # On the worker once the interrupted turn has stopped writing to the interpreter
+            try:
+                session.reset()
+            finally:
+                loop.call_soon_threadsafe(reset.set_result, None)
+
+        await loop.run_in_executor(None, self.scheduler.interrupt, session.id, "reset", reset_now)
+        await reset
+        return web.json_response(session.info())
+
+    async def post_message(self, request):
+        # Streams newline-delimited JSON events, ending with a "done" event; with "stream": false only
+        # the "done" event is returned
+        session = self.require_session(request)
+        body = await self.read_json(request)
+        message = body.get("message")
+        if not isinstance(message, str) or not message.strip():
+            return web.json_response({"error": "message is required"}, status=400)
+        turn, stream = self.start_turn(session, message.strip(), body.get("preempt"))
+        if turn.status == "rejected":
+            return web.json_response({"error": "too many queued messages for this session"}, status=429)
+        self.count("http_turns")
+
+        if not body.get("stream", True):
+            try:
+                async for event in stream.events():
+                    if event["event"] == "done":
+                        return web.json_response(event)
+            except asyncio.CancelledError:
+                turn.cancel("disconnected")
+                raise
+
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        self.count("open_streams")
+        try:
+            async for event in stream.events():
+                # Waits for the socket to drain, which is what holds the worker back for slow clients
+                await response.write((json.dumps(event, default=str) + "\n").encode('utf-8'))
+        except (ConnectionResetError, asyncio.CancelledError):
+            self.count("disconnects")
+            turn.cancel("disconnected")
+            raise
+        finally:
+            self.count("open_streams", -1)
+        await response.write_eof()
+        return response
+
+    async def websocket(self, request):
+        # Client messages: {"type": "message", "message": "...", "preempt": bool} and {"type": "cancel"}.
+        # Server messages: the same events as the HTTP stream, each tagged with its request_id
+        session = self.require_session(request)
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.count("open_websockets")
+        pumps = set()
+
+        async def pump(turn, stream):
+            async for event in stream.events():
+                event.setdefault("request_id", turn.id)
+                if ws.closed:
+                    turn.cancel("disconnected")
+                    continue
+                await ws.send_json(event, dumps=lambda value: json.dumps(value, default=str))
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    data = json.loads(msg.data)
+                except json.JSONDecodeError:
+                    await ws.send_json({"event": "error", "error": "invalid JSON"})
+                    continue
+                if data.get("type") == "cancel":
+                    self.scheduler.cancel(session.id, reason="stopped")
+                elif data.get("type") == "message" and isinstance(data.get("message"), str) and data["message"].strip():
+                    turn, stream = self.start_turn(session, data["message"].strip(), data.get("preempt"))
+                    if turn.status == "rejected":
+                        await ws.send_json({"event": "done", "request_id": turn.id, "status": "rejected"})
+                        continue
+                    self.count("websocket_turns")
+                    task = asyncio.create_task(pump(turn, stream))
+                    pumps.add(task)
+                    task.add_done_callback(pumps.discard)
+                else:
+                    await ws.send_json({"event": "error", "error": "expected a message or cancel"})
+        finally:
+            self.count("open_websockets", -1)
+            # Nobody is left to read the answers
+            self.scheduler.cancel(session.id, reason="disconnected")
+            for task in pumps:
+                task.cancel()
+        return ws
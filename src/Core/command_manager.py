@@ -1,5 +1,4 @@
 import base64
-import pyautogui
 from PIL import Image
 import io
 import re
@@ -26,6 +25,8 @@ class CommandExecutor:
     return None
 
   def take_screenshot_command(self, query):
+    # Imported here because pyautogui needs a display, which the headless server doesn't have
+    import pyautogui
     screenshot = pyautogui.screenshot()
     buffered = io.BytesIO()
     screenshot.save(buffered, format="PNG")
@@ -0,0 +1,96 @@
+import re
+from abc import ABC, abstractmethod
+from langchain.schema import Document
+from langchain.retrievers.document_compressors import LLMChainExtractor
+
+COMPRESSION_MODES = ("off", "local", "llm")
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_\-]*")
+# Sentence ends, blank lines and the start of list items all count as boundaries
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\n(?=\s*(?:[-*#]|\d+[.)])\s)")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "please", "so", "that", "the", "this", "to", "was", "what",
+    "when", "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+
+def tokenize(text):
+    terms = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if len(word) < 2:
+            continue
+        # Crude plural folding so "skills" matches "skill"
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class ContextCompressor(ABC):
+    name = "base"
+
+    @abstractmethod
+    def compress(self, docs, query, query_embedding=None):
+        raise NotImplementedError
+
+
+class NoCompressor(ContextCompressor):
+    name = "off"
+
+    def compress(self, docs, query, query_embedding=None):
+        return list(docs)
+
+
+class LocalExtractiveCompressor(ContextCompressor):
+    # Keeps the sentences of each document that share the most terms with the query
+    name = "local"
+
+    def __init__(self, max_sentences=5, min_score=0.2):
+        self.max_sentences = max_sentences
+        self.min_score = min_score
+
+    def compress(self, docs, query, query_embedding=None):
+        query_terms = set(tokenize(query)) - STOPWORDS
+        if not query_terms:
+            return list(docs)
+
+        compressed_docs = []
+        for doc in docs:
+            sentences = [s.strip() for s in SENTENCE_PATTERN.split(doc.page_content) if s and s.strip()]
+            scored = []
+            for index, sentence in enumerate(sentences):
+                score = len(query_terms & set(tokenize(sentence))) / len(query_terms)
+                if score >= self.min_score:
+                    scored.append((score, index, sentence))
+            if not scored:
+                continue
+            best = sorted(scored, key=lambda item: item[0], reverse=True)[:self.max_sentences]
+            # Restore document order so the extract still reads naturally
+            kept = [sentence for _, _, sentence in sorted(best, key=lambda item: item[1])]
+            compressed_docs.append(Document(
+                page_content="\n".join(kept),
+                metadata={**doc.metadata, "compression_score": best[0][0]},
+            ))
+        return compressed_docs
+
+
+class LLMCompressor(ContextCompressor):
+    name = "llm"
+
+    def __init__(self, llm):
+        self.extractor = LLMChainExtractor.from_llm(llm)
+
+    def compress(self, docs, query, query_embedding=None):
+        return list(self.extractor.compress_documents(docs, query)) if docs else []
+
+
+def create_compressor(mode, get_llm):
+    # get_llm is only called for the LLM compressor, so the other modes never build a chat model
+    if mode == "off":
+        return NoCompressor()
+    if mode == "local":
+        return LocalExtractiveCompressor()
+    if mode == "llm":
+        return LLMCompressor(get_llm())
+    raise ValueError(f"Unknown compression mode '{mode}', expected one of {COMPRESSION_MODES}")
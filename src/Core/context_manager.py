@@ -1,66 +1,200 @@
-from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import LLMChainExtractor
-from langchain_openai import ChatOpenAI
 import os
-from interpreter import interpreter
-from Settings.config import CHROMA_PATH, KB_PATH, SYSTEM_MESSAGE
+import threading
+import time
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait
+from langchain.schema import Document
+from Settings.config import CHROMA_PATH, RETRIEVAL_SETTINGS, UNIFIED_INDEX_SETTINGS
+from Core.embedding_cache import get_embedding_function
+from Core.retriever_registry import retriever_registry
+from Core.kb_registry import kb_registry
+from Core.semantic_cache import semantic_cache
+from Core.ingestion_manifest import chunk_id
+from Core.vector_stores import open_unified_store, unified_ids
+
+# Shared by every ContextManager so concurrent chats don't multiply retrieval threads
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_SETTINGS["max_parallel_kbs"],
+                                        thread_name_prefix="retrieval")
+
+# Searches that outlived their deadline, by KB. A running future can't be cancelled, so a hung KB is
+# skipped until its last search returns instead of tying up another executor thread per query
+stragglers = {}  # {kb label: Future}
+stragglers_lock = threading.Lock()
+
+
+def track_straggler(label, future):
+    with stragglers_lock:
+        stragglers[label] = future
+    future.add_done_callback(lambda _: release_straggler(label, future))
+
+
+def release_straggler(label, future):
+    with stragglers_lock:
+        if stragglers.get(label) is future:
+            del stragglers[label]
+
+
+def still_running(label):
+    with stragglers_lock:
+        return label in stragglers
 
 class ContextManager:
     def __init__(self, chat_ui):
         self.chat_ui = chat_ui
         self.openai_key = os.environ["OPENAI_API_KEY"]
-        self.embedding_function = OpenAIEmbeddings(openai_api_key=self.openai_key)
+        self.embedding_function = get_embedding_function()
+
+    def retrieve_from_kb(self, kb, query_text, query_embedding):
+        # Reuse the open DB and compressor for this knowledge base
+        with retriever_registry.checkout(kb) as entry:
+            # Search by the shared query embedding so the store doesn't embed the query again
+            vector_docs = entry.db.search_by_vector(
+                query_embedding, k=RETRIEVAL_SETTINGS["candidate_k"], fetch_k=RETRIEVAL_SETTINGS["fetch_k"]
+            )
+
+            # Reciprocal rank fusion of the vector hits and the BM25 hits
+            rankings = [[self.document_id(doc) for doc in vector_docs]]
+            if RETRIEVAL_SETTINGS["hybrid"]:
+                rankings.append([id_ for id_, _ in entry.bm25_index.search(query_text,
+                                                                           RETRIEVAL_SETTINGS["candidate_k"])])
+            docs = self.fuse_rankings(rankings, vector_docs, entry.db, RETRIEVAL_SETTINGS["k"])
+
+            # Compress the retrieved documents with the compressor this KB is configured for
+            compressed_docs = entry.compressor.compress(docs, query_text, query_embedding)
+        for doc in compressed_docs:
+            doc.metadata['knowledge_base'] = kb  # Add KB info to metadata
+        return compressed_docs
+
+    def document_id(self, doc, unified=False):
+        id_ = chunk_id(doc.metadata.get("source", ""), doc.metadata.get("start_index"), doc.page_content)
+        return unified_ids(doc.metadata["knowledge_base"], [id_])[0] if unified else id_
+
+    def fuse_rankings(self, rankings, vector_docs, db, k, unified=False):
+        # Reciprocal rank fusion of ranked id lists; documents only found lexically are fetched from db
+        rrf_k = RETRIEVAL_SETTINGS["rrf_k"]
+        docs_by_id = {self.document_id(doc, unified): doc for doc in vector_docs}
+        scores = {}
+        for ranking in rankings:
+            for rank, id_ in enumerate(ranking):
+                scores[id_] = scores.get(id_, 0.0) + 1 / (rrf_k + rank + 1)
+        missing_ids = [id_ for id_ in scores if id_ not in docs_by_id]
+        if missing_ids:
+            found = db.get(ids=missing_ids)
+            for id_, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                docs_by_id[id_] = Document(page_content=text, metadata=metadata or {})
+
+        ranked = sorted((id_ for id_ in scores if id_ in docs_by_id), key=scores.get, reverse=True)
+        docs = []
+        for id_ in ranked[:k]:
+            doc = docs_by_id[id_]
+            doc.metadata['relevance_score'] = scores[id_]
+            docs.append(doc)
+        return docs
+
+    def retrieve_unified(self, kbs, query_text, query_embedding):
+        # One search over the unified index, filtered to the selected KBs, instead of one search per KB
+        store = open_unified_store(self.embedding_function)
+        with ExitStack() as checkouts:
+            entries = {kb: checkouts.enter_context(retriever_registry.checkout(kb)) for kb in kbs}
+            return self.search_unified(store, entries, kbs, query_text, query_embedding)
+
+    def search_unified(self, store, entries, kbs, query_text, query_embedding):
+        vector_docs = store.search_by_vector(query_embedding, k=RETRIEVAL_SETTINGS["candidate_k"],
+                                             fetch_k=RETRIEVAL_SETTINGS["fetch_k"], knowledge_bases=kbs)
+        rankings = [[self.document_id(doc, unified=True) for doc in vector_docs]]
+        if RETRIEVAL_SETTINGS["hybrid"]:
+            # Lexical indexes stay per KB; they are small SQLite lookups
+            for kb, entry in entries.items():
+                lexical_hits = entry.bm25_index.search(query_text, RETRIEVAL_SETTINGS["candidate_k"])
+                rankings.append(unified_ids(kb, [id_ for id_, _ in lexical_hits]))
+        docs = self.fuse_rankings(rankings, vector_docs, store, RETRIEVAL_SETTINGS["top_n"], unified=True)
+
+        # Each KB's documents still go through the compressor that KB is configured for
+        compressed_docs = []
+        for kb, entry in entries.items():
+            kb_docs = [doc for doc in docs if doc.metadata.get("knowledge_base") == kb]
+            if not kb_docs:
+                continue
+            for doc in entry.compressor.compress(kb_docs, query_text, query_embedding):
+                doc.metadata['knowledge_base'] = kb
+                compressed_docs.append(doc)
+        return compressed_docs
 
     def query_vector_database(self, query_text, selected_kbs):
+        start = time.perf_counter()
         all_compressed_docs = []
+        futures = {}
+        searchable_kbs = []
 
         for kb in selected_kbs:
-            db_path = os.path.join(CHROMA_PATH, kb)
-            kb_path = os.path.join(KB_PATH, kb)
-            if not os.path.exists(db_path):
-                print(f"Warning: Database for {kb} not found at {db_path}")
+            if not kb_registry.get(kb).indexed:
+                print(f"Warning: Database for {kb} not found at {os.path.join(CHROMA_PATH, kb)}")
                 continue
+            searchable_kbs.append(kb)
 
-            # Check for instructions.txt and add to custom_instructions if exists
-            instructions_path = os.path.join(kb_path, "instructions.txt")
-            if os.path.exists(instructions_path):
-                with open(instructions_path, 'r') as file:
-                    instructions = file.read()
-                    interpreter.custom_instructions = instructions
-
-            # Prepare the DB and retriever for this knowledge base
-            db = Chroma(persist_directory=db_path, embedding_function=self.embedding_function)
-            base_retriever = db.as_retriever(search_type="mmr", search_kwargs={"k": 5, "fetch_k": 25})
-
-            # Set up the contextual compression retriever
-            llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini")
-            compressor = LLMChainExtractor.from_llm(llm)
-            compression_retriever = ContextualCompressionRetriever(
-                base_compressor=compressor,
-                base_retriever=base_retriever
-            )
+        if not searchable_kbs:
+            return [], []
 
-            # Retrieve and compress relevant documents
-            compressed_docs = compression_retriever.invoke(query_text)
-            for doc in compressed_docs:
-                doc.metadata['knowledge_base'] = kb  # Add KB info to metadata
-            all_compressed_docs.extend(compressed_docs)
+        # Embed the query once for every knowledge base
+        query_embedding = self.embedding_function.embed_query(query_text)
 
-        # Sort all compressed docs by relevance (assuming there's a relevance score in metadata)
-        all_compressed_docs.sort(key=lambda x: x.metadata.get('relevance_score', 0), reverse=True)
+        # Repeated or near-identical questions over the same KBs skip retrieval entirely
+        cache_generation = semantic_cache.generation(searchable_kbs)
+        # The local compressor's output depends on the query's exact terms
+        cache_text = query_text if any(kb_registry.get(kb).config["compression"] == "local"
+                                       for kb in searchable_kbs) else None
+        cached = semantic_cache.lookup(query_embedding, searchable_kbs, cache_text)
+        if cached is not None:
+            print(f"Semantic cache hit: {semantic_cache.stats()}")
+            return cached
+
+        busy_kbs = []
+        if UNIFIED_INDEX_SETTINGS["enabled"]:
+            label = ", ".join(searchable_kbs)
+            if still_running(label):
+                busy_kbs.append(label)
+            else:
+                futures[retrieval_executor.submit(self.retrieve_unified, searchable_kbs, query_text,
+                                                  query_embedding)] = label
+        else:
+            # Search every knowledge base at the same time
+            for kb in searchable_kbs:
+                if still_running(kb):
+                    busy_kbs.append(kb)
+                    continue
+                futures[retrieval_executor.submit(self.retrieve_from_kb, kb, query_text, query_embedding)] = kb
 
-        # Take the top 10 most relevant documents
-        top_docs = all_compressed_docs[:10]
+        # Merge whatever finished before the deadline; slow KBs are reported instead of waited on
+        done, not_done = wait(futures, timeout=RETRIEVAL_SETTINGS["deadline_seconds"])
+        timed_out_kbs = [futures[future] for future in not_done]
+        failed_kbs = []
+        for future in done:
+            try:
+                all_compressed_docs.extend(future.result())
+            except Exception as e:
+                failed_kbs.append(futures[future])
+                print(f"Error querying {futures[future]}: {e}")
+        for future in not_done:
+            if not future.cancel():
+                track_straggler(futures[future], future)
+        if timed_out_kbs:
+            print(f"Retrieval deadline reached, skipped: {timed_out_kbs}")
+        if busy_kbs:
+            print(f"Still searching from an earlier query, skipped: {busy_kbs}")
+        timed_out_kbs.extend(busy_kbs)
 
-        # Format the context
-        context = "\n\n".join(doc.page_content for doc in top_docs)
+        # Sort all compressed docs by their fused relevance score
+        all_compressed_docs.sort(key=lambda x: x.metadata.get('relevance_score', 0), reverse=True)
+
+        # Take the top most relevant documents; ChatManager packs them into the prompt's token budget
+        top_docs = all_compressed_docs[:RETRIEVAL_SETTINGS["top_n"]]
 
         # Get the sources with knowledge base information
         sources = [f"{doc.metadata.get('source', 'Unknown')} (KB: {doc.metadata['knowledge_base']})" for doc in top_docs]
+        sources.extend(f"KB: {kb} timed out and was skipped" for kb in timed_out_kbs)
 
-        return context, sources
-
-    def clear_custom_instructions(self):
-        interpreter.system_message = SYSTEM_MESSAGE
\ No newline at end of file
+        # Only complete results are worth serving again
+        if not timed_out_kbs and not failed_kbs:
+            semantic_cache.store(query_embedding, searchable_kbs, (top_docs, sources),
+                                 (time.perf_counter() - start) * 1000, cache_generation, cache_text)
+        return top_docs, sources
@@ -0,0 +1,112 @@
+import logging
+from langchain.schema import Document
+
+_encoding = None
+
+
+def count_tokens(text):
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+            logging.warning("tiktoken unavailable, estimating tokens as characters / 4")
+    if _encoding is False:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def overlap_length(previous, current, min_overlap=20, max_overlap=400):
+    # Length of the longest suffix of previous that is also a prefix of current
+    for length in range(min(len(previous), len(current), max_overlap), min_overlap - 1, -1):
+        if previous.endswith(current[:length]):
+            return length
+    return 0
+
+
+class PackedContext:
+    def __init__(self):
+        self.instructions = []
+        self.chunks = []  # Documents
+        self.skills = []
+        self.usage = {"instructions": 0, "chunks": 0, "skills": 0}
+        self.dropped = {"instructions": 0, "chunks": 0, "skills": 0, "duplicate_chunks": 0}
+
+    @property
+    def total_tokens(self):
+        return sum(self.usage.values())
+
+    @property
+    def context_text(self):
+        return "\n\n".join(doc.page_content for doc in self.chunks)
+
+
+class ContextPacker:
+    # Fills a token budget in priority order: KB instructions, then retrieved chunks, then skills
+    def __init__(self, budget_tokens):
+        self.budget_tokens = budget_tokens
+
+    def dedupe_chunks(self, chunks):
+        # Neighbouring chunks share up to chunk_overlap characters; trim the repeat or drop contained chunks
+        kept = []
+        duplicates = 0
+        for doc in chunks:
+            text = doc.page_content
+            source = doc.metadata.get("source")
+            for other in kept:
+                if other.metadata.get("source") != source:
+                    continue
+                if text in other.page_content:
+                    text = ""
+                    break
+                text = text[overlap_length(other.page_content, text):]
+                text = text[:len(text) - overlap_length(text, other.page_content)]
+            if not text.strip():
+                duplicates += 1
+                continue
+            if text != doc.page_content:
+                doc = Document(page_content=text.strip(), metadata=doc.metadata)
+            kept.append(doc)
+        return kept, duplicates
+
+    def pack(self, instructions, chunks, skills):
+        packed = PackedContext()
+        remaining = self.budget_tokens
+
+        for text in instructions:
+            if not text or not text.strip():
+                continue
+            tokens = count_tokens(text)
+            if tokens <= remaining:
+                packed.instructions.append(text.strip())
+                packed.usage["instructions"] += tokens
+                remaining -= tokens
+            else:
+                packed.dropped["instructions"] += 1
+
+        unique_chunks, packed.dropped["duplicate_chunks"] = self.dedupe_chunks(chunks)
+        for doc in unique_chunks:
+            tokens = count_tokens(doc.page_content)
+            if tokens <= remaining:
+                packed.chunks.append(doc)
+                packed.usage["chunks"] += tokens
+                remaining -= tokens
+            else:
+                packed.dropped["chunks"] += 1
+
+        for skill in skills:
+            # A skill is its text, or (inline text, reference text) falling back to the reference if the inline doesn't fit
+            options = [skill] if isinstance(skill, str) else [option for option in skill if option]
+            for option in options:
+                tokens = count_tokens(option)
+                if tokens <= remaining:
+                    packed.skills.append(option)
+                    packed.usage["skills"] += tokens
+                    remaining -= tokens
+                    break
+            else:
+                packed.dropped["skills"] += 1
+
+        return packed
@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from Core.context_packer import count_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+IMAGE_PLACEHOLDER = "[image from an earlier turn omitted]"
+
+SUMMARY_PROMPT = """Summarize the conversation below between a user and an assistant that runs code on the user's machine.
+Keep the facts, decisions, file paths, commands, results and open tasks the assistant may need later. Be concise.
+
+{conversation}"""
+
+
+def is_image_payload(message):
+    return message.get("type") == "image" and str(message.get("format", "")).startswith("base64")
+
+
+def message_tokens(message):
+    content = str(message.get("content") or "")
+    if is_image_payload(message):
+        # Tokenizing megabytes of base64 is slow; the estimate is only needed against the threshold
+        return len(content) // 4
+    return count_tokens(content)
+
+
+def conversation_tokens(messages):
+    return sum(message_tokens(message) for message in messages)
+
+
+def last_user_index(messages):
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index].get("role") == "user":
+            return index
+    return 0
+
+
+class ConversationCompactor:
+    # Bounds interpreter.messages over long sessions: past threshold_tokens the older turns are summarized
+    # in the background and swapped in before the next turn, while recent turns stay verbatim
+    def __init__(self, threshold_tokens, keep_recent_tokens, summary_model, summary_max_tokens=500,
+                 max_message_chars=2000, enabled=True):
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent_tokens = keep_recent_tokens
+        self.summary_model = summary_model
+        self.summary_max_tokens = summary_max_tokens
+        self.max_message_chars = max_message_chars
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.llm = None
+        self.worker = None
+        self.pending = None  # (snapshot, split, compacted older messages, tokens before, seconds)
+        self.generation = 0  # Bumped by discard() so a summary of a reset chat is never applied
+        self.history = []  # [{"before_tokens", "after_tokens", "seconds", "summarized"}]
+
+    def get_llm(self):
+        if self.llm is None:
+            from langchain_openai import ChatOpenAI
+            self.llm = ChatOpenAI(temperature=0, model_name=self.summary_model, max_tokens=self.summary_max_tokens)
+        return self.llm
+
+    def split_point(self, messages):
+        # Earliest user message from which the rest fits in keep_recent_tokens; at least the last turn is kept
+        split = last_user_index(messages)
+        recent_tokens = conversation_tokens(messages[split:])
+        for index in range(split - 1, -1, -1):
+            recent_tokens += message_tokens(messages[index])
+            if recent_tokens > self.keep_recent_tokens:
+                break
+            if messages[index].get("role") == "user":
+                split = index
+        return split
+
+    def schedule(self, messages):
+        # Called after a turn completes; the work happens off the chat thread
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.pending is not None or (self.worker and self.worker.is_alive()):
+                return
+            before_tokens = conversation_tokens(messages)
+            if before_tokens < self.threshold_tokens:
+                return
+            snapshot = list(messages)
+            split = self.split_point(snapshot)
+            if split < 2:
+                return
+            self.worker = threading.Thread(target=self.compact, args=(snapshot, split, before_tokens, self.generation),
+                                           daemon=True)
+            self.worker.start()
+
+    def compact(self, snapshot, split, before_tokens, generation):
+        start = time.perf_counter()
+        older = snapshot[:split]
+        try:
+            summary = self.summarize(older)
+            compacted = [{"role": "assistant", "type": "message", "content": f"{SUMMARY_PREFIX}\n{summary}"}]
+        except Exception as e:
+            # Without a summary, still shed the bulk: images and long outputs of old turns
+            logging.warning(f"Conversation summary failed, clipping older turns instead: {e}")
+            compacted = [self.clip(message) for message in older]
+        with self.lock:
+            if generation == self.generation:
+                self.pending = (snapshot, split, compacted, before_tokens, time.perf_counter() - start)
+
+    def render(self, message):
+        if is_image_payload(message):
+            return f"{message.get('role')}: {IMAGE_PLACEHOLDER}"
+        content = str(message.get("content") or "")[:self.max_message_chars]
+        kind = message.get("type", "message")
+        return f"{message.get('role')} ({kind}): {content}" if kind != "message" else f"{message.get('role')}: {content}"
+
+    def summarize(self, messages):
+        conversation = "\n\n".join(self.render(message) for message in messages)
+        return self.get_llm().invoke(SUMMARY_PROMPT.format(conversation=conversation)).content.strip()
+
+    def clip(self, message):
+        if is_image_payload(message):
+            return {"role": message.get("role"), "type": "message", "content": IMAGE_PLACEHOLDER}
+        content = message.get("content")
+        if isinstance(content, str) and len(content) > self.max_message_chars:
+            return dict(message, content=content[:self.max_message_chars] + "\n[...truncated]")
+        return message
+
+    def prepare(self, interpreter):
+        # Called before a turn starts, while the interpreter is idle, so its message list can be swapped safely
+        messages = interpreter.messages
+        changed = False
+        with self.lock:
+            pending = self.pending
+            self.pending = None
+        if pending is not None:
+            snapshot, split, compacted, before_tokens, seconds = pending
+            # Only valid if the conversation still starts with what was summarized
+            if len(messages) >= len(snapshot) and messages[:split] == snapshot[:split]:
+                messages = compacted + messages[split:]
+                changed = True
+                after_tokens = conversation_tokens(messages)
+                summarized = compacted[0].get("content", "").startswith(SUMMARY_PREFIX)
+                self.history.append({"before_tokens": before_tokens, "after_tokens": after_tokens,
+                                     "seconds": round(seconds, 2), "summarized": summarized})
+                print(f"Compacted conversation from {before_tokens} to {after_tokens} tokens in {seconds:.2f}s "
+                      f"({'summarized' if summarized else 'clipped'})")
+            else:
+                logging.info("Conversation changed while it was being compacted, discarding the compaction")
+
+        # Images are only useful to the turn that produced them
+        keep_from = last_user_index(messages)
+        if any(is_image_payload(message) for message in messages[:keep_from]):
+            messages = [self.clip(message) if index < keep_from and is_image_payload(message) else message
+                        for index, message in enumerate(messages)]
+            changed = True
+        if changed:
+            interpreter.messages = messages
+
+    def discard(self):
+        with self.lock:
+            self.generation += 1
+            self.pending = None
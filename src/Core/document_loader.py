@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from langchain.schema import Document
+
+NATIVE_EXTENSIONS = {".txt", ".md", ".csv", ".json", ".pdf"}
+
+
+def list_document_files(docs_path):
+    # Walk docs/ recursively, skipping hidden files and folders
+    file_paths = []
+    if not os.path.isdir(docs_path):
+        return file_paths
+    for dirpath, dirnames, filenames in os.walk(docs_path):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if not filename.startswith(".") and "." in filename:
+                file_paths.append(os.path.join(dirpath, filename))
+    return file_paths
+
+
+def read_text(path):
+    with open(path, 'r', encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def parse_csv(path):
+    # One record per row, formatted like langchain's CSVLoader
+    records = []
+    with open(path, 'r', encoding="utf-8", errors="replace", newline="") as f:
+        for row_number, row in enumerate(csv.DictReader(f)):
+            text = "\n".join(f"{key}: {value}" for key, value in row.items() if key is not None)
+            records.append((text, {"row": row_number}))
+    return records
+
+
+def parse_json(path):
+    with open(path, 'r', encoding="utf-8", errors="replace") as f:
+        data = json.load(f)
+    return [(json.dumps(data, indent=2, ensure_ascii=False), {})]
+
+
+def parse_pdf(path):
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [(page.extract_text() or "", {"page": page_number})
+            for page_number, page in enumerate(reader.pages)]
+
+
+def parse_with_unstructured(path):
+    from langchain_community.document_loaders import UnstructuredFileLoader
+    return [(doc.page_content, doc.metadata) for doc in UnstructuredFileLoader(path).load()]
+
+
+def parse_file(path):
+    # Runs in a worker process, so it only returns plain picklable data
+    start = time.perf_counter()
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension in (".txt", ".md"):
+            records = [(read_text(path), {})]
+        elif extension == ".csv":
+            records = parse_csv(path)
+        elif extension == ".json":
+            records = parse_json(path)
+        elif extension == ".pdf":
+            try:
+                records = parse_pdf(path)
+            except ImportError:
+                records = parse_with_unstructured(path)
+        else:
+            records = parse_with_unstructured(path)
+        error = None
+    except Exception as e:
+        records, error = [], str(e)
+    return path, records, time.perf_counter() - start, error
+
+
+class DocumentLoader:
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timings = []  # [(path, seconds, record_count), ...] from the last load
+
+    def iter_parsed(self, file_paths):
+        # Small batches aren't worth the cost of starting worker processes
+        if self.max_workers == 1 or len(file_paths) < 2:
+            for path in file_paths:
+                yield parse_file(path)
+            return
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(file_paths))) as executor:
+            # Keep only a small window of files in flight so parsed text doesn't pile up in memory
+            pending = deque()
+            for path in file_paths:
+                pending.append(executor.submit(parse_file, path))
+                if len(pending) >= self.max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def iter_documents(self, file_paths):
+        self.timings = []
+        for path, records, elapsed, error in self.iter_parsed(list(file_paths)):
+            if error:
+                print(f"Error loading {path}: {error}")
+            self.timings.append((path, elapsed, len(records)))
+            for text, metadata in records:
+                if text.strip():
+                    yield Document(page_content=text, metadata={**metadata, "source": path})
+
+    def load(self, file_paths):
+        return list(self.iter_documents(file_paths))
+
+    def timing_report(self, limit=10):
+        total = sum(elapsed for _, elapsed, _ in self.timings)
+        lines = [f"Parsed {len(self.timings)} files in {total:.2f}s of worker time"]
+        for path, elapsed, count in sorted(self.timings, key=lambda t: t[1], reverse=True)[:limit]:
+            lines.append(f"  {elapsed:7.3f}s  {count:5d} records  {path}")
+        return "\n".join(lines)
@@ -0,0 +1,158 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from Settings.config import EMBEDDING_CACHE_SETTINGS
+
+
+def embedding_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path, max_size_mb):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self.conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                      [(now, key) for key in found])
+                self.conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+            self.evict()
+
+    def evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM embeddings ORDER BY last_access"):
+            if total - freed <= target:
+                break
+            doomed.append((key,))
+            freed += size
+        self.conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self.conn.commit()
+        logging.info(f"Embedding cache evicted {len(doomed)} entries ({freed} bytes)")
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "size_bytes": size,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying, cache, model_name, batch_size=256, query_cache_size=256):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name
+        self.batch_size = batch_size
+        # Recent query embeddings stay in memory so repeated questions skip even the SQLite lookup
+        self.query_cache = OrderedDict()
+        self.query_cache_size = query_cache_size
+        self.query_cache_hits = 0
+        self.query_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        keys = [embedding_key(self.model_name, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once, in large batches
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), self.batch_size):
+            batch = missing_items[start:start + self.batch_size]
+            embedded = self.underlying.embed_documents([text for _, text in batch])
+            new_items = [(key, vector) for (key, _), vector in zip(batch, embedded)]
+            self.cache.put_many(new_items)
+            vectors.update(new_items)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        key = text.strip()
+        with self.query_lock:
+            if key in self.query_cache:
+                self.query_cache.move_to_end(key)
+                self.query_cache_hits += 1
+                return self.query_cache[key]
+        vector = self.embed_documents([key])[0]
+        with self.query_lock:
+            self.query_cache[key] = vector
+            while len(self.query_cache) > self.query_cache_size:
+                self.query_cache.popitem(last=False)
+        return vector
+
+
+_embedding_function = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_function():
+    # One cache-backed embedding function shared by ingestion and retrieval
+    global _embedding_function
+    with _embedding_lock:
+        if _embedding_function is None:
+            underlying = OpenAIEmbeddings(model=EMBEDDING_CACHE_SETTINGS["model"])
+            cache = EmbeddingCache(EMBEDDING_CACHE_SETTINGS["path"], EMBEDDING_CACHE_SETTINGS["max_size_mb"])
+            _embedding_function = CachedEmbeddings(underlying, cache, EMBEDDING_CACHE_SETTINGS["model"],
+                                                   EMBEDDING_CACHE_SETTINGS["batch_size"],
+                                                   EMBEDDING_CACHE_SETTINGS["query_cache_size"])
+        return _embedding_function
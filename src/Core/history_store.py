@@ -0,0 +1,283 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from Settings.config import HISTORY_SETTINGS
+
+LOG_FILENAME = "history.jsonl"
+INDEX_FILENAME = "history_index.sqlite3"
+IMPORT_MARKER_FILENAME = ".json_imported"
+IMAGE_PLACEHOLDER = "[image]"
+
+
+def fts_query(text):
+    # Quote every term so user text can't be parsed as FTS syntax
+    terms = re.findall(r"\w+", text.lower())
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def history_record(conversation_id, role, content, message_type="message", timestamp=None):
+    return {
+        "conversation_id": conversation_id,
+        "timestamp": timestamp or time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "role": role,
+        "type": message_type,
+        "content": content,
+    }
+
+
+def records_from_messages(conversation_id, messages, timestamp=None):
+    records = []
+    for message in messages:
+        content = message.get("content")
+        if message.get("type") == "image":
+            content = IMAGE_PLACEHOLDER
+        if not content:
+            continue
+        records.append(history_record(conversation_id, message.get("role", ""), str(content),
+                                      message.get("type", "message"), timestamp))
+    return records
+
+
+def query_from_prompt(content):
+    # Old conversation files hold the packed prompt; keep the user's own words after its trailing "Query:"
+    if isinstance(content, str) and "Query:" in content:
+        return content.rsplit("Query:", 1)[1].strip()
+    return content.strip() if isinstance(content, str) else content
+
+
+def open_index(index_path):
+    conn = sqlite3.connect(index_path, check_same_thread=False)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+            "content, conversation_id UNINDEXED, timestamp UNINDEXED, role UNINDEXED, type UNINDEXED)"
+        )
+    except sqlite3.OperationalError:
+        # SQLite builds without FTS5 get a plain table searched with LIKE
+        conn.execute("CREATE TABLE IF NOT EXISTS messages (content TEXT, conversation_id TEXT, timestamp TEXT, "
+                     "role TEXT, type TEXT)")
+    conn.commit()
+    return conn
+
+
+def has_fts(conn):
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages'").fetchone()
+    return bool(row and "fts5" in row[0].lower())
+
+
+def search_index(conn, query, limit=10, conversation_id=None):
+    if not query.strip():
+        return []
+    conversation_filter = " AND conversation_id = ?" if conversation_id else ""
+    extra = [conversation_id] if conversation_id else []
+    if has_fts(conn):
+        match = fts_query(query)
+        if not match:
+            return []
+        rows = conn.execute(
+            "SELECT conversation_id, timestamp, role, snippet(messages, 0, '[', ']', '...', 24) FROM messages "
+            f"WHERE messages MATCH ?{conversation_filter} ORDER BY bm25(messages) LIMIT ?",
+            [match] + extra + [limit],
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT conversation_id, timestamp, role, substr(content, 1, 200) FROM messages "
+            f"WHERE content LIKE ?{conversation_filter} ORDER BY timestamp DESC LIMIT ?",
+            [f"%{query}%"] + extra + [limit],
+        ).fetchall()
+    return [{"conversation_id": conversation_id, "timestamp": timestamp, "role": role, "snippet": snippet}
+            for conversation_id, timestamp, role, snippet in rows]
+
+
+def search_history(query, limit=10, conversation_id=None, history_path=None):
+    # Entry point for the model's code: a read-only search of past conversations, best matches first
+    index_path = os.path.join(history_path or HISTORY_SETTINGS["path"], INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return []
+    conn = sqlite3.connect(f"file:{os.path.abspath(index_path)}?mode=ro", uri=True)
+    try:
+        return search_index(conn, query, limit, conversation_id)
+    finally:
+        conn.close()
+
+
+class HistoryStore:
+    # Conversation history as an append-only JSONL log (the source of truth) plus a SQLite FTS index.
+    # Writes are queued and batched on a background thread so the chat never waits on disk
+    def __init__(self, path, flush_interval=1.0, batch_size=200):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.log_path = os.path.join(path, LOG_FILENAME)
+        self.index_path = os.path.join(path, INDEX_FILENAME)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.conn = open_index(self.index_path)
+        self.catch_up()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True, name="history-writer")
+        self.writer.start()
+        atexit.register(self.close)
+
+    def indexed_log_size(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'log_size'").fetchone()
+        return int(row[0]) if row else 0
+
+    def catch_up(self):
+        # Index log lines written before a crash (or by a deleted index) but never committed to the index
+        if not os.path.exists(self.log_path):
+            return
+        indexed = self.indexed_log_size()
+        if os.path.getsize(self.log_path) <= indexed:
+            return
+        records = []
+        complete = indexed  # End of the last whole line
+        with open(self.log_path, 'rb') as f:
+            f.seek(indexed)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                complete += len(line)
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logging.warning("Skipping a corrupt line in the history log")
+        if complete < os.path.getsize(self.log_path):
+            # Cut off mid-write by a crash; drop it so the next append starts on a fresh line
+            logging.warning("Dropping a truncated last line from the history log")
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(complete)
+        with self.lock:
+            self.index_records(records, complete)
+        logging.info(f"Indexed {len(records)} history records from the log")
+
+    def index_records(self, records, log_size):
+        self.conn.executemany(
+            "INSERT INTO messages (content, conversation_id, timestamp, role, type) VALUES (?, ?, ?, ?, ?)",
+            [(r["content"], r["conversation_id"], r["timestamp"], r["role"], r["type"]) for r in records],
+        )
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('log_size', ?)", (str(log_size),))
+        self.conn.commit()
+
+    def append(self, records):
+        for record in records:
+            self.queue.put(record)
+
+    def record_turn(self, conversation_id, user_input, messages):
+        # The user's own words, not the packed prompt the interpreter saw, followed by the replies
+        self.append([history_record(conversation_id, "user", user_input)] +
+                    records_from_messages(conversation_id, [m for m in messages if m.get("role") != "user"]))
+
+    def write_loop(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            stop = None in batch
+            batch = [record for record in batch if record is not None]
+            if batch:
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    logging.error(f"Failed to write {len(batch)} history records: {e}")
+            if stop:
+                return
+
+    def write(self, records):
+        with self.lock:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                log_size = f.tell()
+            self.index_records(records, log_size)
+
+    def search(self, query, limit=10, conversation_id=None):
+        with self.lock:
+            return search_index(self.conn, query, limit, conversation_id)
+
+    def import_json_files(self):
+        # One-time import of the per-message Context_*.json files the interpreter used to write
+        # The marker sits next to the log rather than in the index, which can be rebuilt from the log
+        marker = os.path.join(self.path, IMPORT_MARKER_FILENAME)
+        if os.path.exists(marker):
+            return 0
+        imported = 0
+        records = []
+        # The old UI started a new file for every message, each holding the whole conversation so far.
+        # A file that extends an earlier one continues its conversation and only adds its new messages
+        conversations = []  # [(conversation_id, messages so far)]
+        json_files = sorted(glob.glob(os.path.join(self.path, "*.json")),
+                            key=lambda path: (os.path.getmtime(path), path))
+        for json_file in json_files:
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    messages = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"Could not import {json_file}: {e}")
+                continue
+            if not isinstance(messages, list):
+                continue
+            messages = [m for m in messages if isinstance(m, dict)]
+            if not messages:
+                continue
+            timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(os.path.getmtime(json_file)))
+            extended = [(len(seen), index) for index, (_, seen) in enumerate(conversations)
+                        if len(seen) <= len(messages) and messages[:len(seen)] == seen]
+            index = max(extended)[1] if extended else None
+            seen = conversations[index][1] if extended else []
+            if index is None:
+                conversation_id = os.path.splitext(os.path.basename(json_file))[0]
+                conversations.append((conversation_id, messages))
+            else:
+                conversation_id = conversations[index][0]
+                conversations[index] = (conversation_id, messages)
+            new_messages = [dict(m, content=query_from_prompt(m.get("content"))) if m.get("role") == "user" else m
+                            for m in messages[len(seen):]]
+            records.extend(records_from_messages(conversation_id, new_messages, timestamp))
+            imported += 1
+            if len(records) >= self.batch_size:
+                self.write(records)
+                records = []
+        if records:
+            self.write(records)
+        # Marked only once everything is on disk, so an interrupted import runs again
+        with open(marker, 'w') as f:
+            f.write(time.strftime("%Y-%m-%dT%H:%M:%S"))
+        print(f"Imported {imported} conversation files into the history store")
+        return imported
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join(timeout=5)
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+
+def get_history_store():
+    global _history_store
+    with _history_store_lock:
+        if _history_store is not None:
+            return _history_store
+        _history_store = HistoryStore(
+            HISTORY_SETTINGS["path"],
+            flush_interval=HISTORY_SETTINGS["flush_interval"],
+            batch_size=HISTORY_SETTINGS["batch_size"],
+        )
+        threading.Thread(target=_history_store.import_json_files, daemon=True).start()
+        return _history_store
@@ -0,0 +1,132 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from Core.ingestion_pipeline import IngestionCancelled
+
+
+class IngestionJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, knowledge_base, files=None, urls=None):
+        self.id = next(self._ids)
+        self.kind = kind  # "refresh" or "add"
+        self.knowledge_base = knowledge_base
+        self.files = list(files or [])
+        self.urls = list(urls or [])
+        self.status = "queued"  # queued, running, done, failed or cancelled
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.files_total = 0
+        self.pipeline = None  # Set by KnowledgeManager while the job is ingesting
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.status == "queued":
+            self.status = "cancelled"
+            self.finished_at = time.time()
+
+    @property
+    def is_finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def files_parsed(self):
+        return self.pipeline.sources_loaded if self.pipeline else 0
+
+    @property
+    def chunks_embedded(self):
+        return self.pipeline.chunks_embedded if self.pipeline else 0
+
+    def eta(self):
+        # Seconds left, extrapolated from the rate files have been parsed so far
+        if self.status != "running" or not self.files_parsed or not self.files_total:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / self.files_parsed * max(self.files_total - self.files_parsed, 0)
+
+    def describe(self):
+        text = f"#{self.id} {self.kind} {self.knowledge_base}: {self.status}"
+        if self.kind == "refresh" and self.status in ("running", "done", "cancelled"):
+            text += f" - {self.files_parsed}/{self.files_total} sources, {self.chunks_embedded} chunks"
+            eta = self.eta()
+            if eta is not None:
+                text += f", ETA {eta:.0f}s"
+        if self.error:
+            text += f" ({self.error})"
+        return text
+
+
+class IngestionJobQueue:
+    def __init__(self, knowledge_manager, workers=1, history=20):
+        self.knowledge_manager = knowledge_manager
+        self.history = history
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.all_jobs = []
+        for _ in range(workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    def submit(self, job):
+        with self.lock:
+            self.all_jobs.append(job)
+            # Forget the oldest finished jobs so the status list stays short
+            finished = [j for j in self.all_jobs if j.is_finished]
+            for old_job in finished[:max(len(finished) - self.history, 0)]:
+                self.all_jobs.remove(old_job)
+        self.pending.put(job)
+        logging.info(f"Queued ingestion job {job.describe()}")
+        return job
+
+    def submit_refresh(self, knowledge_base):
+        return self.submit(IngestionJob("refresh", knowledge_base))
+
+    def submit_add(self, knowledge_base, files=None, urls=None):
+        return self.submit(IngestionJob("add", knowledge_base, files, urls))
+
+    def jobs(self):
+        with self.lock:
+            return list(self.all_jobs)
+
+    def active_jobs(self):
+        return [job for job in self.jobs() if not job.is_finished]
+
+    def cancel(self, job_id):
+        for job in self.jobs():
+            if job.id == job_id:
+                job.cancel()
+                return True
+        return False
+
+    def worker(self):
+        while True:
+            job = self.pending.get()
+            if job.cancel_event.is_set():
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                if job.kind == "refresh":
+                    self.knowledge_manager.build_vector_database(job.knowledge_base, job=job)
+                else:
+                    for file_path in job.files:
+                        if job.cancel_event.is_set():
+                            raise IngestionCancelled()
+                        self.knowledge_manager.add_to_knowledge_base(job.knowledge_base, file_path=file_path)
+                    for url in job.urls:
+                        if job.cancel_event.is_set():
+                            raise IngestionCancelled()
+                        self.knowledge_manager.add_to_knowledge_base(job.knowledge_base, url=url)
+                job.status = "done"
+            except IngestionCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                logging.exception(f"Ingestion job #{job.id} failed")
+                job.status = "failed"
+                job.error = str(e)
+            job.finished_at = time.time()
+            logging.info(f"Finished ingestion job {job.describe()}")
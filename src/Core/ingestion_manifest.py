@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+import os
+
+MANIFEST_FILENAME = "ingestion_manifest.json"
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hash_bytes(text.encode("utf-8"))
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, start_index, text: str) -> str:
+    # Stable ID so an unchanged chunk always maps to the same row in the store
+    return hash_text(f"{source}|{start_index}|{text}")
+
+
+class IngestionManifest:
+    def __init__(self, db_path):
+        self.path = os.path.join(db_path, MANIFEST_FILENAME)
+        self.sources = {}  # {source: {"hash": content_hash, "chunk_ids": [...]}}
+        self.store = "chroma"  # Vector store the chunks were written to; manifests predating stores used Chroma
+        self.load()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        if not self.exists():
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.sources = data.get("sources", {})
+            self.store = data.get("store", "chroma")
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read ingestion manifest {self.path}: {e}")
+            self.sources = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"store": self.store, "sources": self.sources}, f)
+        os.replace(tmp_path, self.path)
+
+    def diff(self, current_hashes):
+        # Returns (sources to ingest, sources to drop) compared to the last run
+        changed = [source for source, content_hash in current_hashes.items()
+                   if self.sources.get(source, {}).get("hash") != content_hash]
+        removed = [source for source in self.sources if source not in current_hashes]
+        return changed, removed
+
+    def chunk_ids(self, sources):
+        ids = []
+        for source in sources:
+            ids.extend(self.sources.get(source, {}).get("chunk_ids", []))
+        return ids
+
+    def record(self, source, content_hash, chunk_ids):
+        self.sources[source] = {"hash": content_hash, "chunk_ids": list(chunk_ids)}
+
+    def forget(self, source):
+        self.sources.pop(source, None)
@@ -0,0 +1,119 @@
+import queue
+import threading
+from Core.ingestion_manifest import chunk_id
+
+_DONE = object()
+
+
+class IngestionCancelled(Exception):
+    pass
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+class IngestionPipeline:
+    # load -> split -> embed -> upsert, with bounded queues between the stages so
+    # only a few batches of chunks are ever held in memory at once
+    def __init__(self, embedding_function, split_document, batch_size=64, queue_size=256, cancel_event=None):
+        self.embedding_function = embedding_function
+        self.split_document = split_document
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.cancel_event = cancel_event or threading.Event()
+        self.stop_event = threading.Event()
+        self.sources_loaded = 0
+        self.documents_loaded = 0
+        self.chunks_embedded = 0
+
+    def stopped(self):
+        return self.stop_event.is_set() or self.cancel_event.is_set()
+
+    def put(self, q, item):
+        # Blocks while the next stage is busy, but gives up once the pipeline is stopped
+        while not self.stopped():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def split_stage(self, documents, chunk_queue):
+        last_source = None
+        try:
+            for document in documents:
+                if self.stopped():
+                    return
+                self.documents_loaded += 1
+                if document.metadata.get("source") != last_source:
+                    last_source = document.metadata.get("source")
+                    self.sources_loaded += 1
+                for chunk in self.split_document(document):
+                    if not self.put(chunk_queue, chunk):
+                        return
+            self.put(chunk_queue, _DONE)
+        except Exception as e:
+            self.put(chunk_queue, _StageError(e))
+
+    def embed_stage(self, chunk_queue, batch_queue):
+        seen_ids = set()
+        batch = []
+        try:
+            while not self.stopped():
+                try:
+                    item = chunk_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if isinstance(item, _StageError):
+                    self.put(batch_queue, item)
+                    return
+                if item is not _DONE:
+                    id_ = chunk_id(item.metadata.get("source", ""), item.metadata.get("start_index"), item.page_content)
+                    # The same chunk can appear twice in one source; keep the first occurrence
+                    if id_ not in seen_ids:
+                        seen_ids.add(id_)
+                        batch.append((id_, item))
+                if batch and (len(batch) >= self.batch_size or item is _DONE):
+                    embeddings = self.embedding_function.embed_documents([chunk.page_content for _, chunk in batch])
+                    self.chunks_embedded += len(batch)
+                    if not self.put(batch_queue, ([id_ for id_, _ in batch], [chunk for _, chunk in batch], embeddings)):
+                        return
+                    batch = []
+                if item is _DONE:
+                    self.put(batch_queue, _DONE)
+                    return
+        except Exception as e:
+            self.put(batch_queue, _StageError(e))
+
+    def run(self, documents):
+        # Yields (ids, chunks, embeddings) batches for the caller to upsert
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        batch_queue = queue.Queue(maxsize=2)
+        threads = [
+            threading.Thread(target=self.split_stage, args=(documents, chunk_queue), daemon=True),
+            threading.Thread(target=self.embed_stage, args=(chunk_queue, batch_queue), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                try:
+                    item = batch_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self.cancel_event.is_set():
+                        raise IngestionCancelled()
+                    continue
+                if item is _DONE:
+                    break
+                if isinstance(item, _StageError):
+                    raise item.error
+                if self.cancel_event.is_set():
+                    raise IngestionCancelled()
+                yield item
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join(timeout=5)
@@ -1,60 +1,46 @@
 import os
 import json
-import customtkinter as ctk
-from Settings.config import INTERPRETER_SETTINGS, COMPUTER_SYSTEM_MESSAGE, SYSTEM_MESSAGE
+from Settings.config import INTERPRETER_SETTINGS, COMPUTER_SYSTEM_MESSAGE, SYSTEM_MESSAGE, SYSTEM_MESSAGE_ENV_VARS
 from interpreter import interpreter
-from tkinter import messagebox  # Import messagebox from tkinter
+from Core.prompt_builder import PromptBuilder, bullet_list
+from Core.provider_config import PROVIDER_CONFIG_PATH, PROVIDER_KEYS
 
 class InterpreterManager:
-  def __init__(self, knowledge_manager =None, chat_ui = None):
+  def __init__(self, knowledge_manager =None, chat_ui = None, interpreter_instance = None):
     self.knowledge_manager = knowledge_manager  # Initialize knowledge_manager
     self.chat_ui = chat_ui
+    # The module-level interpreter unless a session brings its own
+    self.interpreter = interpreter_instance or interpreter
+    self.prompt_builder = PromptBuilder(self.interpreter)  # Sole writer of interpreter.system_message
     self.configure_interpreter()
     
     # Initialize any other necessary attributes here
   def configure_interpreter(self):
-    interpreter.llm.supports_vision = INTERPRETER_SETTINGS["supports_vision"]
-    interpreter.auto_run = INTERPRETER_SETTINGS["auto_run"]
-    interpreter.loop = INTERPRETER_SETTINGS["loop"]
-    interpreter.llm.temperature = INTERPRETER_SETTINGS["temperature"]
-    interpreter.llm.max_tokens = INTERPRETER_SETTINGS["max_tokens"]
-    interpreter.llm.context_window = INTERPRETER_SETTINGS["context_window"]
-    interpreter.conversation_history_path = INTERPRETER_SETTINGS["conversation_history_path"]
-    interpreter.computer.import_computer_api = INTERPRETER_SETTINGS["import_computer_api"]
-    interpreter.computer.system_message = COMPUTER_SYSTEM_MESSAGE
-    print(interpreter.computer.system_message)
-    interpreter.system_message = SYSTEM_MESSAGE
+    self.interpreter.llm.supports_vision = INTERPRETER_SETTINGS["supports_vision"]
+    self.interpreter.auto_run = INTERPRETER_SETTINGS["auto_run"]
+    self.interpreter.loop = INTERPRETER_SETTINGS["loop"]
+    self.interpreter.llm.temperature = INTERPRETER_SETTINGS["temperature"]
+    self.interpreter.llm.max_tokens = INTERPRETER_SETTINGS["max_tokens"]
+    self.interpreter.llm.context_window = INTERPRETER_SETTINGS["context_window"]
+    self.interpreter.conversation_history_path = INTERPRETER_SETTINGS["conversation_history_path"]
+    # ChatManager records turns in the history store instead of a JSON file per message
+    self.interpreter.conversation_history = False
+    self.interpreter.computer.import_computer_api = INTERPRETER_SETTINGS["import_computer_api"]
+    self.interpreter.computer.system_message = COMPUTER_SYSTEM_MESSAGE
+    print(self.interpreter.computer.system_message)
+    self.prompt_builder.set_section("base", SYSTEM_MESSAGE)
 
   def configure_provider(self, provider, config):
-    # Common for all providers
-    os.environ["OPENAI_API_KEY"] = config.get("OPENAI_API_KEY", "")
-
-    if provider == "azure":
-      os.environ["AZURE_API_KEY"] = config["AZURE_API_KEY"]
-      os.environ["AZURE_API_BASE"] = config["AZURE_API_BASE"]
-      os.environ["AZURE_API_VERSION"] = config["AZURE_API_VERSION"]
-      model = config["AZURE_MODEL"]
-      interpreter.llm.provider = "azure"
-      interpreter.llm.api_key = os.environ["AZURE_API_KEY"]
-      interpreter.llm.api_base = os.environ["AZURE_API_BASE"]
-      interpreter.llm.api_version = os.environ["AZURE_API_VERSION"]
-      interpreter.llm.model = f"azure/{model}"
-    elif provider == "openai":
-      model = config["OPENAI_MODEL"]
-      interpreter.llm.api_key = os.environ["OPENAI_API_KEY"]
-      interpreter.llm.model = model
-    elif provider == "anthropic":
-      os.environ["ANTHROPIC_API_KEY"] = config["ANTHROPIC_API_KEY"]
-      model = config["ANTHROPIC_MODEL"]
-      interpreter.llm.api_key = os.environ["ANTHROPIC_API_KEY"]
-      interpreter.llm.model = f"anthropic/{model}"
+    # Imported here so the headless server doesn't need Tk
+    from tkinter import messagebox
+    self.apply_provider(provider, config)
 
     # Prompt user to save credentials
     save_credentials = messagebox.askyesno("Save Credentials", "Do you want to save these credentials to provider_config.json?")
     
     if save_credentials:
       try:
-        with open('src/Settings/provider_config.json', 'w') as f:
+        with open(PROVIDER_CONFIG_PATH, 'w') as f:
           json.dump(config, f)
         messagebox.showinfo("Success", "Credentials saved to provider_config.json")
       except Exception as e:
@@ -63,27 +49,74 @@ class InterpreterManager:
     # Set the provider in the configuration
     config['PROVIDER'] = provider
 
+  def apply_provider(self, provider, config):
+    # Configures the interpreter's LLM without any dialogs, so the headless server can use it too
+    # Common for all providers
+    os.environ["OPENAI_API_KEY"] = config.get("OPENAI_API_KEY", "")
+
+    if provider == "azure":
+      os.environ["AZURE_API_KEY"] = config["AZURE_API_KEY"]
+      os.environ["AZURE_API_BASE"] = config["AZURE_API_BASE"]
+      os.environ["AZURE_API_VERSION"] = config["AZURE_API_VERSION"]
+      model = config["AZURE_MODEL"]
+      self.interpreter.llm.provider = "azure"
+      self.interpreter.llm.api_key = os.environ["AZURE_API_KEY"]
+      self.interpreter.llm.api_base = os.environ["AZURE_API_BASE"]
+      self.interpreter.llm.api_version = os.environ["AZURE_API_VERSION"]
+      self.interpreter.llm.model = f"azure/{model}"
+    elif provider == "openai":
+      model = config["OPENAI_MODEL"]
+      self.interpreter.llm.api_key = os.environ["OPENAI_API_KEY"]
+      self.interpreter.llm.model = model
+    elif provider == "anthropic":
+      os.environ["ANTHROPIC_API_KEY"] = config["ANTHROPIC_API_KEY"]
+      model = config["ANTHROPIC_MODEL"]
+      self.interpreter.llm.api_key = os.environ["ANTHROPIC_API_KEY"]
+      self.interpreter.llm.model = f"anthropic/{model}"
+    else:
+      raise ValueError(f"Unknown provider '{provider}', expected one of {list(PROVIDER_KEYS)}")
+
   def update_system_message(self, selected_kbs):
-    # Use self.knowledge_manager to get available skills
-    skills = self.knowledge_manager.get_available_skills()
-    # Append instructions from selected knowledge bases
-    for kb in selected_kbs:
-        instructions = self.knowledge_manager.instructions.get(kb, "")
-        if instructions:
-            interpreter.system_message += "\n" + instructions
-    # Append dynamically retrieved skills with their file paths
-    skill_list = "\n    - ".join([f"{name} (Path: {path})" for name, path in skills])
+    # Changes when the KB selection does: the selected KBs' instructions, and the skills section when
+    # skills become available or unavailable
+    self.update_instructions(selected_kbs)
+    skills = self.knowledge_manager.get_available_skills(selected_kbs)
+    # The skills relevant to each message are included with it, so only describe how to use them here
     SYSTEM_MESSAGE_SKILLS = '''
     ### Skills:
     - You have access to various skills from the selected knowledge bases. Each skill contains step-by-step instructions on how to complete specific tasks.
-    - If you think a skill will help you complete a task, read the contents of the skill file at the provided path to see if it can help you.
-    - If it will help you complete the task, follow the instructions strictly. Do not deviate unless specified otherwise.
+    - The skills relevant to a message are included with it, usually with their full steps. If only a path is given, read the skill file at that path.
+    - If a skill will help you complete the task, follow the instructions strictly. Do not deviate unless specified otherwise.
     - If you receive an error, retry from the last checkpoint.
-    - Here are the skills you have access to:
-    ''' + "\n    - " + skill_list
-    interpreter.system_message = SYSTEM_MESSAGE + "\n" + SYSTEM_MESSAGE_SKILLS
-    # Update the interpreter's system message
-    # Print the updated system message and available skills
-    print(f"System Message Updated:\n{interpreter.system_message}")
+    '''
+    if skills:
+      self.prompt_builder.set_section("skills", SYSTEM_MESSAGE_SKILLS)
+    else:
+      self.prompt_builder.clear_section("skills")
+
+    print(f"Available Skills: {[name + ' (' + path + ')' for name, path in skills]}")
+
+  def update_instructions(self, selected_kbs):
+    # Kept in the system message rather than repeated in every user message; a no-op unless the
+    # selection or an instructions file changed
+    instructions = self.knowledge_manager.get_selected_instructions(selected_kbs)
+    if instructions:
+      self.prompt_builder.set_section("instructions", "### Instructions from the selected knowledge bases:\n" +
+                                      "\n\n".join(text.strip() for text in instructions))
+    else:
+      self.prompt_builder.clear_section("instructions")
+
+  def copy_llm_settings(self, source):
+    # Sessions get the provider, model and credentials configured on the main interpreter
+    for attribute in ("provider", "model", "api_key", "api_base", "api_version"):
+      value = getattr(source.llm, attribute, None)
+      if value is not None:
+        setattr(self.interpreter.llm, attribute, value)
 
-    print(f"Available Skills: {[name + ' (' + path + ')' for name, path in skills]}")
\ No newline at end of file
+  def update_env_vars(self, env_vars):
+    # Only the names go in the prompt; the values stay in the environment
+    custom_env_vars = [key for key in env_vars if key.startswith("CUSTOM_")]
+    if custom_env_vars:
+      self.prompt_builder.set_section("env_vars", SYSTEM_MESSAGE_ENV_VARS + "\n" + bullet_list(custom_env_vars))
+    else:
+      self.prompt_builder.clear_section("env_vars")
\ No newline at end of file
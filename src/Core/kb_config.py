@@ -0,0 +1,19 @@
+import json
+import logging
+import os
+from Settings.config import KB_PATH, DEFAULT_KB_CONFIG
+
+KB_CONFIG_FILENAME = "config.json"
+
+
+def load_kb_config(knowledge_base):
+    # Optional Knowledge/<kb>/config.json overriding DEFAULT_KB_CONFIG for that knowledge base
+    config = dict(DEFAULT_KB_CONFIG)
+    config_file = os.path.join(KB_PATH, knowledge_base, KB_CONFIG_FILENAME)
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r') as f:
+                config.update(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read {config_file}: {e}")
+    return config
@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+from Settings.config import KB_PATH, CHROMA_PATH, KB_REGISTRY_SETTINGS
+from Core.ingestion_manifest import IngestionManifest, MANIFEST_FILENAME
+from Core.kb_config import KB_CONFIG_FILENAME, load_kb_config
+
+
+def modified_time(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class KnowledgeBaseInfo:
+    def __init__(self, name, stamp, instructions, skills, config, indexed, doc_count, chunk_count, store, index_bytes):
+        self.name = name
+        self.stamp = stamp  # mtimes the info was read at
+        self.checked_at = time.monotonic()
+        self.instructions = instructions
+        self.skills = skills  # [(skill_name, skill_path), ...]
+        self.config = config
+        self.indexed = indexed  # Whether the KB has a database to search
+        self.doc_count = doc_count  # Sources in the last ingestion
+        self.chunk_count = chunk_count
+        self.store = store
+        self.index_bytes = index_bytes
+
+
+class KnowledgeBaseRegistry:
+    # Caches what every manager needs to know about a KB. Entries are revalidated by file mtimes at most
+    # once per check_interval, so queries and UI rebuilds never re-read the KB folders
+    def __init__(self, kb_path, db_root, check_interval):
+        self.kb_path = kb_path
+        self.db_root = db_root
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.names = None
+        self.names_stamp = None
+        self.names_checked_at = 0.0
+        self.entries = {}  # {knowledge_base: KnowledgeBaseInfo}
+
+    def knowledge_bases(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.names is None or now - self.names_checked_at >= self.check_interval:
+                self.names_checked_at = now
+                stamp = modified_time(self.kb_path)
+                if self.names is None or stamp != self.names_stamp:
+                    self.names_stamp = stamp
+                    self.names = sorted(d for d in os.listdir(self.kb_path)
+                                        if os.path.isdir(os.path.join(self.kb_path, d)))
+            return list(self.names)
+
+    def paths(self, knowledge_base):
+        kb_path = os.path.join(self.kb_path, knowledge_base)
+        db_path = os.path.join(self.db_root, knowledge_base)
+        return {
+            "kb": kb_path,
+            "instructions": os.path.join(kb_path, "instructions.txt"),
+            "skills": os.path.join(kb_path, "skills"),
+            "config": os.path.join(kb_path, KB_CONFIG_FILENAME),
+            "db": db_path,
+            "manifest": os.path.join(db_path, MANIFEST_FILENAME),
+        }
+
+    def stamp(self, paths):
+        return tuple(modified_time(path) for path in paths.values())
+
+    def get(self, knowledge_base):
+        with self.lock:
+            info = self.entries.get(knowledge_base)
+            if info is not None and time.monotonic() - info.checked_at < self.check_interval:
+                return info
+        paths = self.paths(knowledge_base)
+        stamp = self.stamp(paths)
+        if info is not None and info.stamp == stamp:
+            info.checked_at = time.monotonic()
+            return info
+        info = self.load(knowledge_base, paths, stamp)
+        with self.lock:
+            self.entries[knowledge_base] = info
+        return info
+
+    def load(self, knowledge_base, paths, stamp):
+        instructions = ""
+        if os.path.exists(paths["instructions"]):
+            with open(paths["instructions"], 'r') as f:
+                instructions = f.read()
+
+        skills = []
+        if os.path.exists(paths["skills"]):
+            skills = [(f, os.path.join(paths["skills"], f)) for f in sorted(os.listdir(paths["skills"]))
+                      if f.endswith('.md')]
+
+        manifest = IngestionManifest(paths["db"])
+        index_bytes = 0
+        if os.path.exists(paths["db"]):
+            index_bytes = sum(entry.stat().st_size for entry in os.scandir(paths["db"]) if entry.is_file())
+
+        logging.info(f"Loaded knowledge base info for {knowledge_base}")
+        return KnowledgeBaseInfo(
+            knowledge_base,
+            stamp,
+            instructions,
+            skills,
+            load_kb_config(knowledge_base),
+            indexed=os.path.exists(paths["db"]),
+            doc_count=len(manifest.sources),
+            chunk_count=sum(len(source["chunk_ids"]) for source in manifest.sources.values()),
+            store=manifest.store if manifest.exists() else None,
+            index_bytes=index_bytes,
+        )
+
+    def invalidate(self, knowledge_base=None):
+        # For changes the app makes itself, so they show up without waiting for the next mtime check
+        with self.lock:
+            self.names = None
+            if knowledge_base is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(knowledge_base, None)
+
+
+kb_registry = KnowledgeBaseRegistry(KB_PATH, CHROMA_PATH, KB_REGISTRY_SETTINGS["check_interval"])
@@ -1,11 +1,19 @@
-from langchain_community.document_loaders import DirectoryLoader, WebBaseLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 from dotenv import load_dotenv
 import os
 from Settings.config import *
+from Core.ingestion_manifest import IngestionManifest, hash_file
+from Core.ingestion_pipeline import IngestionCancelled, IngestionPipeline
+from Core.bm25_index import BM25Index
+from Core.embedding_cache import get_embedding_function
+from Core.vector_stores import open_unified_store, open_vector_store, release_vector_store, store_signature, \
+    unified_index_path
+from Core.kb_registry import kb_registry
+from Core.document_loader import DocumentLoader, list_document_files
+from Core.url_fetcher import URLFetcher
+from Core.retriever_registry import retriever_registry
+from Core.semantic_cache import semantic_cache
 import logging
 import shutil
 
@@ -16,150 +24,225 @@ class KnowledgeManager:
     def __init__(self, root):
         self.root = root
         self.selected_kbs = []
-        self.skills = {}  # {knowledge_base: [(skill_name, skill_path), ...]}
-        self.instructions = {}
+        self.url_fetcher = URLFetcher(
+            URL_FETCH_SETTINGS["cache_path"],
+            max_workers=URL_FETCH_SETTINGS["max_workers"],
+            per_host_limit=URL_FETCH_SETTINGS["per_host_limit"],
+            timeout=URL_FETCH_SETTINGS["timeout"],
+        )
 
     def get_knowledge_bases(self):
-        return [d for d in os.listdir(KB_PATH) if os.path.isdir(os.path.join(KB_PATH, d))]
+        return kb_registry.knowledge_bases()
 
     def update_selected_kbs(self, selected_kbs):
-        # Remove skills and instructions from previously selected KBs
-        previous_kbs = set(self.selected_kbs) - set(selected_kbs)
-        for kb in previous_kbs:
-            self.remove_skills(kb)
-            self.remove_instructions(kb)
-        
-        # Add skills and instructions from newly selected KBs
-        new_kbs = set(selected_kbs) - set(self.selected_kbs)
-        for kb in new_kbs:
-            self.load_skills_and_instructions(kb)
-        
+        # Skills and instructions come from the KB registry, which only re-reads them when their files change
         self.selected_kbs = selected_kbs
+        print(f"Available Skills: {self.get_available_skills()}")
 
-    def remove_skills(self, knowledge_base):
-        if knowledge_base in self.skills:
-            del self.skills[knowledge_base]
-            logging.info(f"Removed skills for {knowledge_base}")
-        
-        # Print available skills after removal
-        print(f"Available Skills after removal: {self.get_available_skills()}")
-
-    def remove_instructions(self, knowledge_base):
-        if knowledge_base in self.instructions:
-            del self.instructions[knowledge_base]
-            logging.info(f"Removed instructions for {knowledge_base}")
-            # Print instructions after removal
-            print(f"Instructions after removal for '{knowledge_base}': {self.instructions}")
-
-    def load_skills_and_instructions(self, knowledge_base):
-        kb_path = os.path.join(KB_PATH, knowledge_base)
-        skills_path = os.path.join(kb_path, "skills")
-        instructions_file = os.path.join(kb_path, "instructions.txt")  # Changed to .txt as per the latest file
-
-        # Load skills with their file paths
-        if os.path.exists(skills_path):
-            skill_files = [f for f in os.listdir(skills_path) if f.endswith('.md')]
-            self.skills[knowledge_base] = [(f, os.path.join(skills_path, f)) for f in skill_files]
-        else:
-            self.skills[knowledge_base] = []
-
-        # Load instructions
-        if os.path.exists(instructions_file):
-            with open(instructions_file, 'r') as f:
-                self.instructions[knowledge_base] = f.read()
-        else:
-            self.instructions[knowledge_base] = ""
+    def get_kb_info(self, knowledge_base):
+        return kb_registry.get(knowledge_base)
 
-        # Print available skills after addition
-        print(f"Available Skills after addition: {self.get_available_skills()}")
-
-    def get_available_skills(self):
-        # Collect skills and their paths from all selected knowledge bases
+    def get_available_skills(self, selected_kbs=None):
+        # Collect skills and their paths from all selected knowledge bases, or from a session's selection
         skills = []
-        for kb in self.selected_kbs:
-            skills.extend(self.skills.get(kb, []))
+        for kb in self.selected_kbs if selected_kbs is None else selected_kbs:
+            skills.extend(kb_registry.get(kb).skills)
         return skills
 
-    def load_docs_folder(self, knowledge_base):
+    def get_selected_instructions(self, selected_kbs=None):
+        # Instructions of the selected knowledge bases, in selection order
+        selected_kbs = self.selected_kbs if selected_kbs is None else selected_kbs
+        instructions = [kb_registry.get(kb).instructions for kb in selected_kbs]
+        return [text for text in instructions if text]
+
+    def load_docs_folder(self, knowledge_base, job=None):
         kb_path = os.path.join(KB_PATH, knowledge_base)
         docs_path = os.path.join(kb_path, "docs")
         urls_file = os.path.join(kb_path, "urls.txt")
+        db_path = os.path.join(CHROMA_PATH, knowledge_base)
+
+        manifest = IngestionManifest(db_path)
+        if os.path.exists(db_path) and not manifest.exists():
+            # Databases built before the manifest existed hold untracked (and usually duplicated) chunks
+            print(f"No ingestion manifest for {knowledge_base}, rebuilding {db_path} from scratch.")
+            self.drop_database(knowledge_base)
+            manifest = IngestionManifest(db_path)
+
+        store_type = store_signature(kb_registry.get(knowledge_base).config)
+        if manifest.exists() and manifest.store != store_type:
+            # The chunks live in another backend or layout; re-ingest everything into the configured one
+            print(f"{knowledge_base} moved from the {manifest.store} store to {store_type}, rebuilding {db_path}.")
+            self.drop_database(knowledge_base)
+            manifest = IngestionManifest(db_path)
+        manifest.store = store_type
+
+        bm25_index = BM25Index(db_path)
+        if manifest.exists() and not bm25_index.exists():
+            # KBs ingested before the lexical index existed get it built from their stored chunks
+            self.backfill_bm25_index(self.open_database(knowledge_base), bm25_index)
+
+        # Hash every source so only new or edited ones are loaded and embedded
+        source_hashes = {path: hash_file(path) for path in self.list_document_files(docs_path)}
+        url_results = self.load_urls(urls_file, job.cancel_event if job else None)
+        for url, result in url_results.items():
+            if result.content_hash:
+                source_hashes[url] = result.content_hash
+            elif url in manifest.sources:
+                # Keep the previous chunks of URLs that failed to load this time
+                source_hashes[url] = manifest.sources[url]["hash"]
+
+        changed, removed = manifest.diff(source_hashes)
+        print(f"{knowledge_base}: {len(changed)} new or changed sources, {len(removed)} removed, "
+              f"{len(source_hashes) - len(changed)} unchanged.")
+        if not changed and not removed:
+            return
+
+        db = self.open_database(knowledge_base)
+        # Drop chunks of edited or removed sources before adding the new ones
+        stale_ids = manifest.chunk_ids(changed + removed)
+        if stale_ids:
+            db.delete(stale_ids)
+            bm25_index.delete(stale_ids)
+
+        text_splitter = self.create_text_splitter()
+        changed_files = [source for source in changed if source not in url_results]
+        changed_urls = [url_results[source] for source in changed if source in url_results]
+        pipeline = IngestionPipeline(
+            get_embedding_function(),
+            lambda document: text_splitter.split_documents([document]),
+            batch_size=INGESTION_SETTINGS["batch_size"],
+            queue_size=INGESTION_SETTINGS["queue_size"],
+            cancel_event=job.cancel_event if job else None,
+        )
+        if job:
+            job.files_total = len(changed)
+            job.pipeline = pipeline
+        ids_by_source = {source: [] for source in changed}
+        try:
+            for ids, chunks, embeddings in pipeline.run(self.iter_documents(changed_files, changed_urls)):
+                self.save_to_chroma(db, bm25_index, ids, chunks, embeddings)
+                for id_, chunk in zip(ids, chunks):
+                    ids_by_source.setdefault(chunk.metadata.get("source"), []).append(id_)
+        except IngestionCancelled:
+            # Track what was written without a hash so the next refresh cleans it up and retries
+            for source in changed:
+                manifest.record(source, None, ids_by_source[source])
+            for source in removed:
+                manifest.forget(source)
+            manifest.save()
+            db.persist()
+            self.invalidate_caches(knowledge_base)
+            print(f"Ingestion of {knowledge_base} cancelled.")
+            raise
+
+        db.persist()
+        for source in changed:
+            # A source that produced no chunks (unparseable file, failed fetch) gets no hash, so it's retried
+            ids = ids_by_source[source]
+            manifest.record(source, source_hashes[source] if ids else None, ids)
+        for source in removed:
+            manifest.forget(source)
+        manifest.save()
+        # Queries opened before the rebuild must not keep using the old store
+        self.invalidate_caches(knowledge_base)
+        print(f"Updated {knowledge_base} with {pipeline.chunks_embedded} chunks from {pipeline.documents_loaded} "
+              f"documents, removed {len(stale_ids)} stale chunks.")
+        print(f"Embedding cache: {get_embedding_function().cache.stats()}")
+
+    def drop_database(self, knowledge_base):
+        # Removes the KB's store, manifest and lexical index, and its slice of the unified index; other KBs are untouched
+        self.invalidate_caches(knowledge_base)
+        release_vector_store(knowledge_base)
+        db_path = os.path.join(CHROMA_PATH, knowledge_base)
+        if os.path.exists(db_path):
+            shutil.rmtree(db_path)
+        if os.path.exists(unified_index_path()):
+            open_unified_store(get_embedding_function()).delete_knowledge_base(knowledge_base)
+
+    def invalidate_caches(self, knowledge_base):
+        kb_registry.invalidate(knowledge_base)
+        retriever_registry.invalidate(knowledge_base)
+        semantic_cache.invalidate(knowledge_base)
+
+    def list_document_files(self, docs_path):
+        return list_document_files(docs_path)
 
-        # Load and process documents
-        documents = self.load_documents(docs_path, urls_file)
-        chunks = self.split_text(documents)
-        self.save_to_chroma(chunks, knowledge_base)
-
-    def load_documents(self, docs_path, urls_file):
-        # Load local documents
-        local_loader = DirectoryLoader(docs_path, glob="*.*")
-        local_documents = local_loader.load()
-        print(f"Loaded {len(local_documents)} local documents from {docs_path}")
-
-        # Load URLs
-        url_documents = self.load_urls(urls_file)
-        
-        # Combine local and URL documents
-        all_documents = local_documents + url_documents
-        print(f"Total documents loaded: {len(all_documents)}")
-        return all_documents
-
-    def load_urls(self, urls_file):
+    def iter_documents(self, file_paths, url_results):
+        # Documents are produced lazily so the pipeline never holds the whole corpus
+        loader = DocumentLoader(INGESTION_SETTINGS["loader_workers"])
+        yield from loader.iter_documents(file_paths)
+        if file_paths:
+            print(loader.timing_report())
+        for result in url_results:
+            yield from self.url_fetcher.load_text(result).to_documents()
+
+    def read_urls(self, urls_file):
         if not os.path.exists(urls_file):
-            print(f"No {urls_file} found. Skipping URL loading.")
             return []
-
         with open(urls_file, 'r') as file:
-            urls = file.read().splitlines()
+            return [url.strip() for url in file.read().splitlines() if url.strip()]
 
-        url_documents = []
-        for url in urls:
-            try:
-                loader = WebBaseLoader(url)
-                url_documents.extend(loader.load())
-                print(f"Loaded content from: {url}")
-            except Exception as e:
-                print(f"Error loading {url}: {e}")
+    def load_urls(self, urls_file, cancel_event=None):
+        if not os.path.exists(urls_file):
+            print(f"No {urls_file} found. Skipping URL loading.")
+            return {}
 
-        print(f"Loaded {len(url_documents)} documents from URLs")
-        return url_documents
+        # Fetch concurrently; pages answering 304 Not Modified are neither re-parsed nor re-embedded
+        url_results = self.url_fetcher.fetch_all(self.read_urls(urls_file), cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            # Nothing has been written yet, so there is nothing to record
+            raise IngestionCancelled()
+        for url, result in url_results.items():
+            if result.status == "error":
+                print(f"Error loading {url}: {result.error}")
+            else:
+                print(f"Loaded content from: {url} ({result.status}, {result.elapsed:.2f}s)")
 
-    def split_text(self, documents: list[Document]):
-        text_splitter = RecursiveCharacterTextSplitter(
+        fetched = sum(1 for result in url_results.values() if result.status == "fetched")
+        not_modified = sum(1 for result in url_results.values() if result.status == "not_modified")
+        print(f"Fetched {fetched} URLs, {not_modified} not modified")
+        return url_results
+
+    def create_text_splitter(self):
+        return RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len,
             add_start_index=True,
         )
+
+    def split_text(self, documents: list[Document]):
+        text_splitter = self.create_text_splitter()
         chunks = text_splitter.split_documents(documents)
         print(f"Split {len(documents)} documents into {len(chunks)} chunks.")
         return chunks
 
-    def save_to_chroma(self, chunks: list[Document], knowledge_base: str):
-        db_path = os.path.join(CHROMA_PATH, knowledge_base)
-        embedding_function = OpenAIEmbeddings()
-        
-        # Check if the database already exists
-        if os.path.exists(db_path):
-            # Load the existing database
-            db = Chroma(persist_directory=db_path, embedding_function=embedding_function)
-            
-            # Add new documents to the existing database
-            db.add_documents(chunks)
-        else:
-            # Create a new database if it doesn't exist
-            db = Chroma.from_documents(chunks, embedding_function, persist_directory=db_path)
-        
-        # Persist the changes
-        db.persist()
-        print(f"Updated database with {len(chunks)} chunks in {db_path}.")
+    def open_database(self, knowledge_base):
+        # Chroma or the memory-mapped store, whichever the KB's config.json selects
+        return open_vector_store(knowledge_base, get_embedding_function())
+
+    def save_to_chroma(self, db, bm25_index, ids, chunks: list[Document], embeddings):
+        db.upsert(
+            ids,
+            [chunk.page_content for chunk in chunks],
+            [chunk.metadata for chunk in chunks],
+            embeddings,
+        )
+        # Keep the lexical index in step with the vector store
+        bm25_index.add(ids, [chunk.page_content for chunk in chunks])
+
+    def backfill_bm25_index(self, db, bm25_index):
+        existing = db.get()
+        if existing["ids"]:
+            bm25_index.add(existing["ids"], existing["documents"])
+        print(f"Built lexical index for {len(existing['ids'])} existing chunks.")
 
-    def build_vector_database(self, knowledge_base=None):
+    def build_vector_database(self, knowledge_base=None, job=None):
         if knowledge_base:
             kb_path = os.path.join(KB_PATH, knowledge_base)
             if os.path.isdir(kb_path):
                 print(f"Processing knowledge base: {knowledge_base}")
-                self.load_docs_folder(knowledge_base)
+                self.load_docs_folder(knowledge_base, job)
             else:
                 print(f"Creating new knowledge base.")
                 os.makedirs(os.path.join(kb_path, "docs"), exist_ok=True)
@@ -168,14 +251,17 @@ class KnowledgeManager:
                     pass  # Create an empty urls.txt file
                 with open(os.path.join(kb_path, "instructions.txt"), 'w') as f:
                     pass  # Create an empty instructions.txt file
-                self.load_docs_folder(knowledge_base)
+                kb_registry.invalidate(knowledge_base)
+                self.load_docs_folder(knowledge_base, job)
         else:
             # Update all knowledge bases
             knowledge_bases = self.get_knowledge_bases()
             
             for kb in knowledge_bases:
+                if job and job.cancel_event.is_set():
+                    raise IngestionCancelled()
                 print(f"Processing knowledge base: {kb}")
-                self.load_docs_folder(kb)
+                self.load_docs_folder(kb, job)
 
     def add_to_knowledge_base(self, kb_name, url=None, file_path=None):
         kb_path = os.path.join(KB_PATH, kb_name)
@@ -197,4 +283,5 @@ class KnowledgeManager:
             logging.info(f"Copying file from {file_path} to {dest_path}")
             shutil.copy2(file_path, dest_path)
 
+        kb_registry.invalidate(kb_name)
         print(f"Added to knowledge base: {kb_name}")
\ No newline at end of file
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+import threading
+from Core.context_packer import count_tokens
+
+# Bump when the way sections are assembled changes, so old and new prompts never share a version
+PROMPT_FORMAT_VERSION = 2
+
+# Static sections first and volatile ones last, so a change only breaks the provider's prompt cache
+# from that section on
+SECTION_ORDER = ("base", "skills", "instructions", "env_vars")
+
+
+def normalize_section(text):
+    # Trailing whitespace and blank-line runs vary with how a section was written, not what it says
+    lines = [line.rstrip() for line in (text or "").strip().splitlines()]
+    normalized = []
+    for line in lines:
+        if line or (normalized and normalized[-1]):
+            normalized.append(line)
+    return "\n".join(normalized)
+
+
+def bullet_list(items):
+    # Sorted and deduplicated so the same set always renders the same way
+    return "\n".join(f"- {item}" for item in sorted(set(items)))
+
+
+class PromptBuilder:
+    # Owns interpreter.system_message: every change goes through set_section, and the message is
+    # rebuilt deterministically from the named sections
+    def __init__(self, target):
+        self.target = target  # Object whose system_message is kept up to date, normally the interpreter
+        self.lock = threading.Lock()
+        self.sections = {}  # {name: normalized text}
+        self.prompt = ""
+        self.version = None
+        self.revision = 0
+
+    def set_section(self, name, text):
+        if name not in SECTION_ORDER:
+            raise ValueError(f"Unknown prompt section '{name}', expected one of {SECTION_ORDER}")
+        with self.lock:
+            text = normalize_section(text)
+            if self.sections.get(name, "") == text:
+                return False
+            previous = dict(self.sections)
+            if text:
+                self.sections[name] = text
+            else:
+                self.sections.pop(name, None)
+            self.apply(previous)
+            return True
+
+    def clear_section(self, name):
+        return self.set_section(name, "")
+
+    def build(self):
+        parts = []
+        for name in SECTION_ORDER:
+            text = self.sections.get(name)
+            # The same text set by two callers is only sent once
+            if text and text not in parts:
+                parts.append(text)
+        return "\n\n".join(parts)
+
+    def prompt_version(self, prompt):
+        # Content-addressed, so an identical prompt has the same version across turns and sessions
+        return f"v{PROMPT_FORMAT_VERSION}-{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}"
+
+    def apply(self, previous):
+        prompt = self.build()
+        previous_version = self.version
+        self.prompt = prompt
+        self.version = self.prompt_version(prompt)
+        self.revision += 1
+        self.target.system_message = prompt
+        logging.info(json.dumps(self.diff(previous, previous_version)))
+        print(f"System message {self.version} (revision {self.revision}, {count_tokens(prompt)} tokens)")
+
+    def diff(self, previous, previous_version):
+        changes = {}
+        stable_prefix_tokens = 0
+        prefix_intact = True
+        for name in SECTION_ORDER:
+            before, after = previous.get(name, ""), self.sections.get(name, "")
+            if before == after:
+                if prefix_intact:
+                    stable_prefix_tokens += count_tokens(after) if after else 0
+                continue
+            prefix_intact = False
+            changes[name] = {
+                "change": "added" if not before else "removed" if not after else "modified",
+                "tokens_before": count_tokens(before) if before else 0,
+                "tokens_after": count_tokens(after) if after else 0,
+            }
+        return {
+            "event": "system_prompt_changed",
+            "version": self.version,
+            "previous_version": previous_version,
+            "revision": self.revision,
+            "sections": changes,
+            "total_tokens": count_tokens(self.prompt),
+            "stable_prefix_tokens": stable_prefix_tokens,
+        }
@@ -0,0 +1,43 @@
+import json
+import os
+
+PROVIDER_CONFIG_PATH = 'src/Settings/provider_config.json'
+
+# Credentials each provider needs, as entered in the provider selection window
+PROVIDER_KEYS = {
+    "openai": ["OPENAI_API_KEY", "OPENAI_MODEL"],
+    "azure": ["OPENAI_API_KEY", "AZURE_API_KEY", "AZURE_API_BASE", "AZURE_API_VERSION", "AZURE_MODEL"],
+    "anthropic": ["OPENAI_API_KEY", "ANTHROPIC_API_KEY", "ANTHROPIC_MODEL"],
+}
+
+
+def infer_provider(config):
+    # Files saved by the provider window don't record the provider, but their keys give it away
+    if config.get("PROVIDER"):
+        return config["PROVIDER"]
+    if config.get("AZURE_API_KEY"):
+        return "azure"
+    if config.get("ANTHROPIC_API_KEY"):
+        return "anthropic"
+    return "openai"
+
+
+def load_provider_config(path=None, environ=None):
+    # Provider and credentials for headless use: the saved provider_config.json, if any, with environment
+    # variables taking precedence. HUMANSCRIPT_PROVIDER picks the provider explicitly
+    environ = os.environ if environ is None else environ
+    path = path or environ.get("HUMANSCRIPT_PROVIDER_CONFIG", PROVIDER_CONFIG_PATH)
+    config = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config = json.load(f)
+    all_keys = {key for keys in PROVIDER_KEYS.values() for key in keys}
+    config.update({key: environ[key] for key in all_keys if environ.get(key)})
+    provider = environ.get("HUMANSCRIPT_PROVIDER") or infer_provider(config)
+    if provider not in PROVIDER_KEYS:
+        raise ValueError(f"Unknown provider '{provider}', expected one of {list(PROVIDER_KEYS)}")
+    missing = [key for key in PROVIDER_KEYS[provider] if not config.get(key)]
+    if missing:
+        raise ValueError(f"Missing {provider} settings: {', '.join(missing)} (set them in {path} or the environment)")
+    config["PROVIDER"] = provider
+    return provider, config
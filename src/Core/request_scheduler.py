@@ -0,0 +1,217 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+_request_ids = itertools.count(1)
+
+
+class ChatRequest:
+    def __init__(self, session_id, user_input, sink=None):
+        self.id = next(_request_ids)
+        self.session_id = session_id
+        self.user_input = user_input
+        self.sink = sink  # Where the handler sends streamed output; the ChatUI renders directly and has none
+        self.result = None  # Set by the handler
+        self.status = "queued"  # queued, running, done, cancelled, rejected or failed
+        self.cancel_event = threading.Event()  # Checked by the handler between streamed chunks
+        self.cancel_reason = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self.callbacks = []
+        self.cancel_callbacks = []
+        self.callback_lock = threading.Lock()
+
+    def add_done_callback(self, callback):
+        # Called with the request once it has finished, been cancelled while queued or been rejected
+        with self.callback_lock:
+            if not self.done.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self, status):
+        self.status = status
+        with self.callback_lock:
+            self.done.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logging.exception(f"Done callback of request {self.id} failed")
+
+    def add_cancel_callback(self, callback):
+        # Called with the request as soon as it is cancelled, so the handler can stop work that wouldn't
+        # notice the cancel_event until its next chunk
+        with self.callback_lock:
+            if not self.cancel_event.is_set():
+                self.cancel_callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self, reason="cancelled"):
+        with self.callback_lock:
+            if self.cancel_event.is_set():
+                return
+            self.cancel_reason = reason
+            self.cancel_event.set()
+            callbacks, self.cancel_callbacks = self.cancel_callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logging.exception(f"Cancel callback of request {self.id} failed")
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def wait_seconds(self):
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+
+class SessionQueue:
+    def __init__(self):
+        self.queue = deque()
+        self.active = None
+        self.worker = None
+
+
+class RequestScheduler:
+    # Runs one chat turn at a time per session. Later input waits in a bounded queue or, with preemption,
+    # cancels the running turn and anything queued behind it so bursts never pile up LLM calls
+    def __init__(self, handler, max_queue=3, preempt=True):
+        self.handler = handler  # Called with a ChatRequest on the session's worker thread
+        self.max_queue = max_queue
+        self.preempt = preempt
+        self.lock = threading.Lock()
+        self.sessions = {}  # {session_id: SessionQueue}
+        self.counters = {"submitted": 0, "done": 0, "cancelled": 0, "rejected": 0, "failed": 0}
+        self.recent_waits = deque(maxlen=100)
+
+    def submit(self, session_id, user_input, preempt=None, sink=None):
+        preempt = self.preempt if preempt is None else preempt
+        request = ChatRequest(session_id, user_input, sink)
+        with self.lock:
+            self.counters["submitted"] += 1
+            session = self.sessions.setdefault(session_id, SessionQueue())
+            dropped = self._cancel_session(session) if preempt else []
+            rejected = len(session.queue) >= self.max_queue
+            if rejected:
+                self.counters["rejected"] += 1
+            else:
+                session.queue.append(request)
+                if session.worker is None:
+                    session.worker = threading.Thread(target=self.run_session, args=(session_id,), daemon=True,
+                                                      name=f"chat-{session_id}")
+                    session.worker.start()
+            depth = len(session.queue)
+        # Callbacks run outside the lock
+        for cancelled in dropped:
+            cancelled.cancel("preempted")
+            if cancelled.status == "queued":
+                cancelled.finish("cancelled")
+        if rejected:
+            logging.warning(f"Rejected request {request.id}: {depth} already queued for {session_id}")
+            request.finish("rejected")
+        else:
+            logging.info(f"Queued request {request.id} for {session_id} (queue depth {depth})")
+        return request
+
+    def _cancel_session(self, session):
+        # Drops the queued requests and returns them with the running turn, for the caller to cancel
+        # and finish outside the lock
+        dropped = list(session.queue)
+        self.counters["cancelled"] += len(dropped)
+        session.queue.clear()
+        if session.active is not None:
+            dropped.append(session.active)
+        return dropped
+
+    def cancel(self, session_id=None, reason="cancelled"):
+        with self.lock:
+            sessions = [self.sessions[session_id]] if session_id in self.sessions else \
+                list(self.sessions.values()) if session_id is None else []
+            dropped = [request for session in sessions for request in self._cancel_session(session)]
+        for request in dropped:
+            request.cancel(reason)
+            if request.status == "queued":
+                request.finish("cancelled")
+
+    def interrupt(self, session_id, reason, callback):
+        # Cancels the session's turns and calls callback once none of them holds the session any more:
+        # on the worker when the running turn has finished, before a later turn can start, or right away
+        # when nothing was running
+        with self.lock:
+            session = self.sessions.get(session_id)
+            active = session.active if session else None
+            if active is not None:
+                active.add_done_callback(lambda request: callback())
+        self.cancel(session_id, reason)
+        if active is None:
+            callback()
+
+    def forget(self, session_id):
+        # For sessions that are gone: cancels their turns and drops their queue once no worker needs it
+        self.cancel(session_id, reason="closed")
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None and session.worker is None:
+                del self.sessions[session_id]
+
+    def run_session(self, session_id):
+        while True:
+            with self.lock:
+                session = self.sessions[session_id]
+                if not session.queue:
+                    session.worker = None
+                    return
+                request = session.queue.popleft()
+                session.active = request
+                request.started_at = time.monotonic()
+                request.status = "running"
+                self.recent_waits.append(request.wait_seconds)
+
+            status = "failed"
+            try:
+                self.handler(request)
+                status = "cancelled" if request.cancelled else "done"
+            except Exception as e:
+                request.error = e
+                logging.exception(f"Request {request.id} failed")
+            finally:
+                request.finished_at = time.monotonic()
+                with self.lock:
+                    session.active = None
+                    self.counters[status] += 1
+                request.finish(status)
+                logging.info(f"Request {request.id} {request.status} after waiting {request.wait_seconds:.2f}s "
+                             f"and running {request.finished_at - request.started_at:.2f}s")
+
+    def has_pending(self, session_id):
+        # True while a turn for the session is queued or running
+        with self.lock:
+            session = self.sessions.get(session_id)
+            return session is not None and (session.active is not None or bool(session.queue))
+
+    def active_request(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            return session.active if session else None
+
+    def stats(self):
+        with self.lock:
+            waits = list(self.recent_waits)
+            return dict(
+                self.counters,
+                queue_depth=sum(len(session.queue) for session in self.sessions.values()),
+                running=sum(1 for session in self.sessions.values() if session.active is not None),
+                average_wait_seconds=round(sum(waits) / len(waits), 3) if waits else 0.0,
+                max_wait_seconds=round(max(waits), 3) if waits else 0.0,
+            )
@@ -0,0 +1,96 @@
+import logging
+import threading
+import numpy as np
+
+
+class PrefetchedRetrieval:
+    def __init__(self, query_text, knowledge_bases):
+        self.query_text = query_text
+        self.knowledge_bases = knowledge_bases
+        self.query_embedding = None
+        self.result = None
+        self.done = threading.Event()
+
+
+class RetrievalPrefetcher:
+    # Starts retrieval on partial input (typing or a draft transcript) so the final query can reuse it
+    def __init__(self, context_manager, debounce_seconds=0.6, similarity_threshold=0.9, min_chars=12,
+                 wait_seconds=2.0, enabled=True):
+        self.context_manager = context_manager
+        self.debounce_seconds = debounce_seconds
+        self.similarity_threshold = similarity_threshold
+        self.min_chars = min_chars
+        self.wait_seconds = wait_seconds
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.timer = None
+        self.current = None  # Latest PrefetchedRetrieval
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, partial_text, selected_kbs, immediate=False):
+        partial_text = partial_text.strip()
+        if not self.enabled or not selected_kbs or len(partial_text) < self.min_chars:
+            return
+        with self.lock:
+            if self.current and self.current.query_text == partial_text:
+                return
+            if self.timer:
+                self.timer.cancel()
+            if immediate:
+                self.timer = None
+                threading.Thread(target=self.prefetch, args=(partial_text, list(selected_kbs)), daemon=True).start()
+            else:
+                # Wait for a pause in typing before spending an embedding call
+                self.timer = threading.Timer(self.debounce_seconds, self.prefetch, args=(partial_text, list(selected_kbs)))
+                self.timer.daemon = True
+                self.timer.start()
+
+    def prefetch(self, query_text, selected_kbs):
+        prefetched = PrefetchedRetrieval(query_text, frozenset(selected_kbs))
+        with self.lock:
+            self.current = prefetched
+        try:
+            prefetched.query_embedding = self.context_manager.embedding_function.embed_query(query_text)
+            prefetched.result = self.context_manager.query_vector_database(query_text, selected_kbs)
+            logging.info(f"Prefetched retrieval for: {query_text}")
+        except Exception as e:
+            logging.warning(f"Retrieval prefetch failed: {e}")
+        finally:
+            prefetched.done.set()
+
+    def cancel(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            self.current = None
+
+    def take(self, final_text, selected_kbs):
+        # Returns the prefetched (docs, sources) if they were retrieved for a close enough query, else None
+        with self.lock:
+            prefetched = self.current
+            self.current = None
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+        if prefetched is None or prefetched.knowledge_bases != frozenset(selected_kbs):
+            return None
+        # A prefetch that is still running is usually nearly done; waiting beats starting over
+        if not prefetched.done.wait(self.wait_seconds) or prefetched.result is None:
+            self.misses += 1
+            return None
+
+        final_text = final_text.strip()
+        if final_text != prefetched.query_text:
+            final_embedding = np.asarray(self.context_manager.embedding_function.embed_query(final_text))
+            prefetched_embedding = np.asarray(prefetched.query_embedding)
+            similarity = float(final_embedding @ prefetched_embedding /
+                               (np.linalg.norm(final_embedding) * np.linalg.norm(prefetched_embedding) or 1.0))
+            if similarity < self.similarity_threshold:
+                logging.info(f"Dropped prefetch for '{prefetched.query_text}' (similarity {similarity:.3f})")
+                self.misses += 1
+                return None
+        self.hits += 1
+        print(f"Using prefetched retrieval for '{prefetched.query_text}' ({self.hits} hits, {self.misses} misses)")
+        return prefetched.result
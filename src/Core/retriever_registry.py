@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from langchain_openai import ChatOpenAI
+from Settings.config import CHROMA_PATH, RETRIEVAL_SETTINGS
+from Core.embedding_cache import get_embedding_function
+from Core.context_compressors import create_compressor
+from Core.kb_registry import kb_registry
+from Core.bm25_index import BM25Index
+from Core.vector_stores import open_vector_store
+
+
+class RetrieverEntry:
+    def __init__(self, knowledge_base, db, compressor, bm25_index):
+        self.knowledge_base = knowledge_base
+        self.db = db  # VectorStore
+        self.compressor = compressor
+        self.bm25_index = bm25_index
+        self.users = 0  # Searches holding the entry, guarded by the registry lock
+        self.retired = False  # Evicted or invalidated; closed once the last search releases it
+
+    def close(self):
+        self.bm25_index.close()
+
+
+class RetrieverRegistry:
+    # Keeps an open vector store and compressor per KB, shared by every chat thread
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # {knowledge_base: RetrieverEntry}, least recently used first
+        self.build_locks = {}  # {knowledge_base: Lock} so two threads never open the same KB twice
+        self.generations = {}  # {knowledge_base: int}, bumped on invalidation
+        self.epoch = 0  # Bumped when every KB is invalidated at once
+        self.llm = None
+
+    def get_llm(self):
+        with self.lock:
+            if self.llm is None:
+                self.llm = ChatOpenAI(temperature=0, model_name=RETRIEVAL_SETTINGS["compression_model"])
+            return self.llm
+
+    @contextmanager
+    def checkout(self, knowledge_base):
+        # The KB's entry, kept open until the search using it is done even if it's evicted meanwhile
+        entry = self.get(knowledge_base)
+        try:
+            yield entry
+        finally:
+            self.release(entry)
+
+    def get(self, knowledge_base):
+        # Returns the entry held for the caller, who must release() it; checkout() does both
+        with self.lock:
+            entry = self.entries.get(knowledge_base)
+            if entry is not None:
+                self.entries.move_to_end(knowledge_base)
+                entry.users += 1
+                return entry
+            build_lock = self.build_locks.setdefault(knowledge_base, threading.Lock())
+
+        with build_lock:
+            with self.lock:
+                entry = self.entries.get(knowledge_base)
+                if entry is not None:
+                    self.entries.move_to_end(knowledge_base)
+                    entry.users += 1
+                    return entry
+                generation = self.generation(knowledge_base)
+            entry = self.build(knowledge_base)
+            retired = []
+            with self.lock:
+                entry.users += 1
+                # Don't cache an entry that was invalidated while it was being opened
+                if self.generation(knowledge_base) == generation:
+                    self.entries[knowledge_base] = entry
+                    while len(self.entries) > self.capacity:
+                        evicted, evicted_entry = self.entries.popitem(last=False)
+                        retired.extend(self.retire(evicted_entry))
+                        logging.info(f"Retriever registry evicted {evicted}")
+                else:
+                    entry.retired = True
+            self.close_entries(retired)
+            return entry
+
+    def release(self, entry):
+        with self.lock:
+            entry.users -= 1
+            closing = entry.retired and entry.users == 0
+        if closing:
+            entry.close()
+
+    def retire(self, entry):
+        # Under the lock; returns the entry if no search holds it, for the caller to close outside the lock
+        entry.retired = True
+        return [entry] if entry.users == 0 else []
+
+    def close_entries(self, entries):
+        for entry in entries:
+            entry.close()
+
+    def generation(self, knowledge_base):
+        return self.epoch, self.generations.get(knowledge_base, 0)
+
+    def build(self, knowledge_base):
+        db_path = os.path.join(CHROMA_PATH, knowledge_base)
+        config = kb_registry.get(knowledge_base).config
+        db = open_vector_store(knowledge_base, get_embedding_function(), config)
+        compressor = create_compressor(config["compression"], self.get_llm)
+        return RetrieverEntry(knowledge_base, db, compressor, BM25Index(db_path))
+
+    def invalidate(self, knowledge_base=None):
+        retired = []
+        with self.lock:
+            if knowledge_base is None:
+                self.epoch += 1
+                for entry in self.entries.values():
+                    retired.extend(self.retire(entry))
+                self.entries.clear()
+            else:
+                self.generations[knowledge_base] = self.generations.get(knowledge_base, 0) + 1
+                entry = self.entries.pop(knowledge_base, None)
+                if entry is not None:
+                    retired.extend(self.retire(entry))
+        self.close_entries(retired)
+
+
+retriever_registry = RetrieverRegistry(RETRIEVAL_SETTINGS["max_open_kbs"])
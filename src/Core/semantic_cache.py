@@ -0,0 +1,123 @@
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from Settings.config import SEMANTIC_CACHE_SETTINGS
+
+
+def normalize_query(text):
+    # Case, spacing and trailing punctuation don't change what a question asks
+    return re.sub(r"\s+", " ", text).strip().rstrip("?.!").strip().lower()
+
+
+class SemanticCacheEntry:
+    def __init__(self, embedding, knowledge_bases, result, cost_ms, query_key=None):
+        self.embedding = embedding
+        self.knowledge_bases = knowledge_bases
+        self.query_key = query_key  # Normalized query text when the result only fits that exact query
+        self.result = result
+        self.cost_ms = cost_ms
+        self.created_at = time.time()
+
+
+class SemanticCache:
+    # Serves retrieval results for questions that are close to a recent one over the same KBs
+    def __init__(self, similarity_threshold=0.98, ttl_seconds=600, capacity=256, enabled=True):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.capacity = capacity
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # {entry_id: SemanticCacheEntry}, least recently used first
+        self.ids = itertools.count()
+        self.generations = {}  # {knowledge_base: int}, bumped on invalidation
+        self.epoch = 0  # Bumped when every KB is invalidated at once
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for entry_id in [entry_id for entry_id, entry in self.entries.items() if entry.created_at < cutoff]:
+            del self.entries[entry_id]
+
+    def lookup(self, query_embedding, knowledge_bases, query_text=None):
+        # With query_text, only a result stored for the same normalized text is served: the extractive
+        # compressor keeps the sentences matching the query's own terms, so a near neighbour's result is wrong
+        if not self.enabled:
+            return None
+        knowledge_bases = frozenset(knowledge_bases)
+        query_key = normalize_query(query_text) if query_text is not None else None
+        query = self.normalize(query_embedding)
+        with self.lock:
+            self.expire()
+            candidates = [(entry_id, entry) for entry_id, entry in self.entries.items()
+                          if entry.knowledge_bases == knowledge_bases and entry.query_key == query_key]
+            if candidates:
+                similarities = np.stack([entry.embedding for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    entry_id, entry = candidates[best]
+                    self.entries.move_to_end(entry_id)
+                    self.hits += 1
+                    self.saved_ms += entry.cost_ms
+                    return entry.result
+            self.misses += 1
+            return None
+
+    def current_generation(self, knowledge_bases):
+        return self.epoch, tuple(sorted((kb, self.generations.get(kb, 0)) for kb in set(knowledge_bases)))
+
+    def generation(self, knowledge_bases):
+        # Taken before retrieving and passed to store(), so a result computed across a KB rebuild isn't cached
+        with self.lock:
+            return self.current_generation(knowledge_bases)
+
+    def store(self, query_embedding, knowledge_bases, result, cost_ms, generation=None, query_text=None):
+        if not self.enabled:
+            return
+        entry = SemanticCacheEntry(self.normalize(query_embedding), frozenset(knowledge_bases), result, cost_ms,
+                                   normalize_query(query_text) if query_text is not None else None)
+        with self.lock:
+            if generation is not None and generation != self.current_generation(entry.knowledge_bases):
+                return
+            self.entries[next(self.ids)] = entry
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, knowledge_base=None):
+        with self.lock:
+            if knowledge_base is None:
+                self.epoch += 1
+                self.entries.clear()
+                return
+            self.generations[knowledge_base] = self.generations.get(knowledge_base, 0) + 1
+            for entry_id in [entry_id for entry_id, entry in self.entries.items()
+                             if knowledge_base in entry.knowledge_bases]:
+                del self.entries[entry_id]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+                "entries": len(self.entries),
+            }
+
+
+semantic_cache = SemanticCache(
+    similarity_threshold=SEMANTIC_CACHE_SETTINGS["similarity_threshold"],
+    ttl_seconds=SEMANTIC_CACHE_SETTINGS["ttl_seconds"],
+    capacity=SEMANTIC_CACHE_SETTINGS["capacity"],
+    enabled=SEMANTIC_CACHE_SETTINGS["enabled"],
+)
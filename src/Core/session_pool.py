@@ -0,0 +1,243 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from interpreter import OpenInterpreter, interpreter
+from Settings.config import INTERPRETER_SETTINGS, SKILL_SETTINGS, WAKE_WORD
+from Core.chat_manager import ChatManager
+from Core.embedding_cache import get_embedding_function
+from Core.interpreter_manager import InterpreterManager
+from Core.skill_index import SkillIndex
+
+
+class SessionPoolFull(Exception):
+    pass
+
+
+class SessionExists(ValueError):
+    pass
+
+
+class ChatSession:
+    # One independent conversation: its own interpreter, system prompt, selected KBs and history.
+    # Exposes the attributes ChatManager reads from the ChatUI, so the chat pipeline runs unchanged
+    def __init__(self, session_id, knowledge_manager, skill_index, template=None, selected_kbs=None):
+        self.id = session_id
+        self.knowledge_manager = knowledge_manager
+        self.selected_kbs = list(selected_kbs or [])
+        self.wake_word = WAKE_WORD
+        self.interpreter_settings = INTERPRETER_SETTINGS.copy()
+        self.env_vars = OrderedDict()
+        self.interpreter_manager = InterpreterManager(knowledge_manager, interpreter_instance=OpenInterpreter())
+        if template is not None:
+            self.interpreter_manager.copy_llm_settings(template)
+        self.chat_manager = ChatManager(self.interpreter_manager, self, skill_index=skill_index)
+        self.chat_manager.update_selected_kbs(self.selected_kbs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.active_turns = 0
+        self.turns = 0
+
+    @property
+    def interpreter(self):
+        return self.interpreter_manager.interpreter
+
+    @property
+    def busy(self):
+        return self.active_turns > 0
+
+    def idle_seconds(self):
+        return 0.0 if self.busy else time.monotonic() - self.last_used
+
+    def update_selected_kbs(self, selected_kbs):
+        self.selected_kbs = list(selected_kbs)
+        self.chat_manager.update_selected_kbs(self.selected_kbs)
+
+    def process_input(self, user_input, cancel_event=None):
+        # Same contract as ChatManager.process_input; the session counts as busy until the stream ends
+        self.active_turns += 1
+        self.last_used = time.monotonic()
+        try:
+            response_generator, sources = self.chat_manager.process_input(user_input, self.selected_kbs, cancel_event)
+        except Exception:
+            self.active_turns -= 1
+            raise
+        return self.track(response_generator), sources
+
+    def track(self, response_generator):
+        try:
+            yield from response_generator
+        finally:
+            self.active_turns -= 1
+            self.turns += 1
+            self.last_used = time.monotonic()
+
+    def final_response(self):
+        messages = self.interpreter.messages
+        if messages and messages[-1]['role'] == 'assistant':
+            return messages[-1]['content']
+        return None
+
+    def reset(self):
+        self.interpreter.reset()
+        self.chat_manager.reset_conversation()
+
+    def close(self):
+        self.chat_manager.prefetcher.cancel()
+        self.chat_manager.compactor.discard()
+        self.interpreter.computer.terminate()
+
+    def info(self):
+        return {
+            "id": self.id,
+            "selected_kbs": self.selected_kbs,
+            "conversation_id": self.chat_manager.conversation_id,
+            "busy": self.busy,
+            "turns": self.turns,
+            "messages": len(self.interpreter.messages),
+            "idle_seconds": round(self.idle_seconds(), 1),
+        }
+
+
+class SessionPool:
+    # Hands out ChatSessions up to max_sessions, evicting the least recently used idle one when full
+    # and any left idle longer than idle_timeout. KB stores, retrievers, caches, the embedding function,
+    # the skill index and the history store are module-level or passed in, so sessions share them
+    def __init__(self, knowledge_manager, template=None, max_sessions=4, idle_timeout=1800, reap_interval=60,
+                 on_close=None, has_pending_turns=None):
+        self.knowledge_manager = knowledge_manager
+        self.on_close = on_close  # Called with the id of every closed or evicted session
+        # Called with a session id; true while a turn for it is queued or running, so sessions whose
+        # turn hasn't reached process_input yet aren't evicted as idle
+        self.has_pending_turns = has_pending_turns
+        self.template = template or interpreter  # Interpreter whose provider settings sessions copy
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.created = threading.Condition(self.lock)  # Notified when a reserved session is built or given up
+        self.sessions = OrderedDict()  # {session_id: ChatSession}, least recently used first
+        self.counters = {"created": 0, "evicted": 0, "closed": 0, "rejected": 0}
+        self.skill_index = SkillIndex(
+            get_embedding_function(),
+            top_k=SKILL_SETTINGS["top_k"],
+            min_similarity=SKILL_SETTINGS["min_similarity"],
+            max_skill_tokens=SKILL_SETTINGS["max_skill_tokens"],
+        )
+        self.stop_event = threading.Event()
+        self.reaper = threading.Thread(target=self.reap_loop, args=(reap_interval,), daemon=True,
+                                       name="session-reaper")
+        self.reaper.start()
+
+    def create(self, session_id=None, selected_kbs=None):
+        session_id = session_id or uuid.uuid4().hex[:12]
+        with self.lock:
+            if session_id in self.sessions:
+                raise SessionExists(f"Session '{session_id}' already exists")
+            evicted = self.evict_idle_locked()
+            if len(self.sessions) >= self.max_sessions:
+                lru = next((session for session in self.sessions.values()
+                            if session is not None and not self.is_busy(session)), None)
+                if lru is None:
+                    self.counters["rejected"] += 1
+                    raise SessionPoolFull(f"All {self.max_sessions} sessions are busy")
+                evicted.append(self.sessions.pop(lru.id))
+                self.counters["evicted"] += 1
+            # Reserved under the lock; the interpreter itself is built outside it
+            self.sessions[session_id] = None
+        self.close_sessions(evicted)
+        try:
+            session = ChatSession(session_id, self.knowledge_manager, self.skill_index, self.template, selected_kbs)
+        except Exception:
+            with self.lock:
+                self.sessions.pop(session_id, None)
+                self.created.notify_all()
+            raise
+        with self.lock:
+            self.sessions[session_id] = session
+            self.counters["created"] += 1
+            self.created.notify_all()
+        logging.info(f"Created session {session_id} ({len(self.sessions)}/{self.max_sessions})")
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+                session.last_used = time.monotonic()
+            return session
+
+    def get_or_create(self, session_id, selected_kbs=None):
+        while True:
+            with self.lock:
+                # Another call is building this session: wait for it instead of failing on the reservation
+                while session_id in self.sessions and self.sessions[session_id] is None:
+                    self.created.wait()
+            session = self.get(session_id)
+            if session is not None:
+                return session
+            try:
+                return self.create(session_id, selected_kbs)
+            except SessionExists:
+                continue  # Reserved by another call since the get
+
+    def is_busy(self, session):
+        return session.busy or (self.has_pending_turns is not None and self.has_pending_turns(session.id))
+
+    def close(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                self.counters["closed"] += 1
+        self.close_sessions([session] if session else [])
+        return session is not None
+
+    def evict_idle_locked(self):
+        expired = [session for session in self.sessions.values()
+                   if session is not None and not self.is_busy(session) and session.idle_seconds() > self.idle_timeout]
+        for session in expired:
+            del self.sessions[session.id]
+            self.counters["evicted"] += 1
+        return expired
+
+    def evict_idle(self):
+        with self.lock:
+            expired = self.evict_idle_locked()
+        self.close_sessions(expired)
+        return len(expired)
+
+    def close_sessions(self, sessions):
+        for session in sessions:
+            try:
+                session.close()
+            except Exception as e:
+                logging.warning(f"Error closing session {session.id}: {e}")
+            if self.on_close is not None:
+                self.on_close(session.id)
+            logging.info(f"Closed session {session.id}")
+
+    def reap_loop(self, interval):
+        while not self.stop_event.wait(interval):
+            self.evict_idle()
+
+    def shutdown(self):
+        self.stop_event.set()
+        with self.lock:
+            sessions = [session for session in self.sessions.values() if session is not None]
+            self.sessions.clear()
+        self.close_sessions(sessions)
+
+    def list_sessions(self):
+        with self.lock:
+            return [session.info() for session in self.sessions.values() if session is not None]
+
+    def stats(self):
+        with self.lock:
+            sessions = [session for session in self.sessions.values() if session is not None]
+            return dict(
+                self.counters,
+                sessions=len(sessions),
+                busy=sum(1 for session in sessions if self.is_busy(session)),
+                max_sessions=self.max_sessions,
+            )
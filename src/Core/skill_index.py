@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+import numpy as np
+from Core.context_packer import count_tokens
+
+
+class Skill:
+    def __init__(self, name, path, content, embedding):
+        self.name = name
+        self.path = path
+        self.content = content
+        self.embedding = embedding  # Normalized
+        self.tokens = count_tokens(content)
+
+    def inline_text(self):
+        return f"### Skill: {self.name} (Path: {self.path})\n{self.content.strip()}\n"
+
+    def reference_text(self):
+        return f"{self.name} (Path: {self.path})\n"
+
+
+class SkillIndex:
+    # Embeds skill markdown files once (and again only when a file changes) so each query can inline
+    # the few relevant skills instead of listing every path for the model to open
+    def __init__(self, embedding_function, top_k=3, min_similarity=0.78, max_skill_tokens=1200, max_embed_chars=8000):
+        self.embedding_function = embedding_function
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.max_skill_tokens = max_skill_tokens
+        self.max_embed_chars = max_embed_chars
+        self.lock = threading.Lock()
+        self.skills = {}  # {path: (mtime, Skill)}
+
+    def load(self, skills):
+        # skills: [(name, path), ...] from the KB registry; returns the indexed Skills
+        stale = []
+        loaded = []
+        with self.lock:
+            for name, path in skills:
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                cached = self.skills.get(path)
+                if cached and cached[0] == mtime:
+                    loaded.append(cached[1])
+                else:
+                    stale.append((name, path, mtime))
+
+        if stale:
+            contents = []
+            for name, path, _ in stale:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    contents.append(f.read())
+            # Embedding cache hits make unchanged skills free even in a new session
+            embeddings = self.embedding_function.embed_documents(
+                [f"{name}\n{content[:self.max_embed_chars]}" for (name, _, _), content in zip(stale, contents)]
+            )
+            with self.lock:
+                for (name, path, mtime), content, embedding in zip(stale, contents, embeddings):
+                    embedding = np.asarray(embedding, dtype=np.float32)
+                    skill = Skill(name, path, content, embedding / (np.linalg.norm(embedding) or 1.0))
+                    self.skills[path] = (mtime, skill)
+                    loaded.append(skill)
+            logging.info(f"Indexed {len(stale)} skills")
+        return loaded
+
+    def warm(self, skills):
+        threading.Thread(target=self.load, args=(skills,), daemon=True).start()
+
+    def closest_skills(self, skills, query):
+        # The top_k skills most similar to the query, best first, with their similarity
+        indexed = self.load(skills)
+        if not indexed or not query.strip():
+            return []
+        query_embedding = np.asarray(self.embedding_function.embed_query(query), dtype=np.float32)
+        query_embedding /= np.linalg.norm(query_embedding) or 1.0
+        scored = sorted(((float(skill.embedding @ query_embedding), skill) for skill in indexed),
+                        key=lambda item: item[0], reverse=True)
+        return scored[:self.top_k]
+
+    def prompt_candidates(self, skills, query):
+        # (inline text, fallback reference) pairs for the context packer; skills too long to inline
+        # are only referenced by path
+        candidates = []
+        closest = self.closest_skills(skills, query)
+        for score, skill in closest:
+            if score < self.min_similarity:
+                continue
+            logging.debug(f"Relevant skill: {skill.name} ({score:.3f})")
+            inline = skill.inline_text() if skill.tokens <= self.max_skill_tokens else None
+            candidates.append((inline, skill.reference_text()))
+        if not candidates and closest:
+            # Nothing scored high enough; name the closest top_k so the model knows they exist
+            candidates.append(f"Other skills, by name only: {', '.join(skill.name for _, skill in closest)}\n")
+        return candidates
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from bs4 import BeautifulSoup
+from langchain.schema import Document
+from Core.ingestion_manifest import hash_text
+
+
+class FetchResult:
+    def __init__(self, url, status, text=None, title=None, content_hash=None, error=None, elapsed=0.0):
+        self.url = url
+        self.status = status  # "fetched", "not_modified", "error" or "cancelled"
+        self.text = text
+        self.title = title
+        self.content_hash = content_hash
+        self.error = error
+        self.elapsed = elapsed
+
+    def to_documents(self):
+        if not self.text:
+            return []
+        metadata = {"source": self.url}
+        if self.title:
+            metadata["title"] = self.title
+        return [Document(page_content=self.text, metadata=metadata)]
+
+
+class URLFetcher:
+    def __init__(self, cache_path, max_workers=8, per_host_limit=2, timeout=15):
+        self.cache_path = cache_path
+        self.index_file = os.path.join(cache_path, "index.json")
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.host_limits = defaultdict(lambda: threading.BoundedSemaphore(self.per_host_limit))
+        self.session = requests.Session()
+        self.index = self.load_index()  # {url: {"etag", "last_modified", "content_hash", "title"}}
+
+    def load_index(self):
+        if not os.path.exists(self.index_file):
+            return {}
+        try:
+            with open(self.index_file, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read URL cache index {self.index_file}: {e}")
+            return {}
+
+    def save_index(self):
+        os.makedirs(self.cache_path, exist_ok=True)
+        tmp_path = self.index_file + ".tmp"
+        with self.lock:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.index, f)
+        os.replace(tmp_path, self.index_file)
+
+    def body_path(self, url):
+        return os.path.join(self.cache_path, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".txt")
+
+    def read_cached_text(self, url):
+        try:
+            with open(self.body_path(url), 'r', encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def host_limit(self, url):
+        with self.lock:
+            return self.host_limits[urlparse(url).netloc]
+
+    def fetch(self, url, cancel_event=None):
+        start = time.perf_counter()
+        if cancel_event is not None and cancel_event.is_set():
+            return FetchResult(url, "cancelled")
+        with self.lock:
+            cached = dict(self.index.get(url, {}))
+        headers = {}
+        # Only send validators if we still have the body they describe
+        if cached and os.path.exists(self.body_path(url)):
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with self.host_limit(url):
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                return FetchResult(url, "not_modified", title=cached.get("title"),
+                                   content_hash=cached.get("content_hash"), elapsed=time.perf_counter() - start)
+            response.raise_for_status()
+
+            soup = BeautifulSoup(response.text, "html.parser")
+            text = soup.get_text()
+            title = soup.title.get_text() if soup.title else None
+            content_hash = hash_text(text)
+
+            os.makedirs(self.cache_path, exist_ok=True)
+            with open(self.body_path(url), 'w', encoding="utf-8") as f:
+                f.write(text)
+            with self.lock:
+                self.index[url] = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "content_hash": content_hash,
+                    "title": title,
+                }
+            return FetchResult(url, "fetched", text=text, title=title, content_hash=content_hash,
+                               elapsed=time.perf_counter() - start)
+        except Exception as e:
+            return FetchResult(url, "error", error=str(e), elapsed=time.perf_counter() - start)
+
+    def fetch_all(self, urls, cancel_event=None):
+        # Once cancel_event is set, URLs not yet started come back as "cancelled" instead of being fetched
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            results = dict(zip(urls, executor.map(lambda url: self.fetch(url, cancel_event), urls)))
+        self.save_index()
+        return results
+
+    def load_text(self, result):
+        # Unchanged pages are only read back from the cache when their chunks are actually needed
+        if result.text is None and result.status == "not_modified":
+            result.text = self.read_cached_text(result.url)
+        return result
@@ -0,0 +1,576 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+import chromadb
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import Chroma
+from Settings.config import CHROMA_PATH, MMAP_STORE_SETTINGS, UNIFIED_INDEX_SETTINGS
+from Core.kb_registry import kb_registry
+
+STORE_TYPES = ("chroma", "mmap")
+QUANTIZATIONS = ("none", "float16", "int8")
+CHROMA_COLLECTION = "langchain"  # langchain's default collection name, so existing stores open unchanged
+
+
+class VectorStore(ABC):
+    # Common interface for the per-KB stores used by ingestion and retrieval
+    store_type = None
+
+    @abstractmethod
+    def upsert(self, ids, texts, metadatas, embeddings):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, ids=None, include_embeddings=False, knowledge_bases=None):
+        # Returns {"ids": [...], "documents": [...], "metadatas": [...]}, plus "embeddings" when asked
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_by_vector(self, embedding, k, fetch_k, knowledge_bases=None):
+        # Max marginal relevance search, returns Documents. knowledge_bases filters on the chunks'
+        # knowledge_base metadata, which only the unified index needs
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_knowledge_base(self, knowledge_base):
+        raise NotImplementedError
+
+    def persist(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ChromaStore(VectorStore):
+    store_type = "chroma"
+
+    def __init__(self, db_path, embedding_function):
+        # The client and collection come from chromadb's public API; langchain's wrapper has no way to
+        # write precomputed embeddings or delete by metadata, so those calls go to the collection directly
+        self.client = chromadb.PersistentClient(path=db_path)
+        self.collection = self.client.get_or_create_collection(CHROMA_COLLECTION, embedding_function=None)
+        self.db = Chroma(client=self.client, collection_name=CHROMA_COLLECTION, embedding_function=embedding_function)
+
+    def upsert(self, ids, texts, metadatas, embeddings):
+        # Pass the embeddings along so Chroma doesn't embed the batch a second time
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=texts)
+
+    def delete(self, ids):
+        if ids:
+            self.db.delete(ids=ids)
+
+    def knowledge_base_filter(self, knowledge_bases):
+        if knowledge_bases is None:
+            return None
+        if len(knowledge_bases) == 1:
+            return {"knowledge_base": knowledge_bases[0]}
+        return {"knowledge_base": {"$in": list(knowledge_bases)}}
+
+    def get(self, ids=None, include_embeddings=False, knowledge_bases=None):
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        return self.collection.get(ids=ids, where=self.knowledge_base_filter(knowledge_bases), include=include)
+
+    def search_by_vector(self, embedding, k, fetch_k, knowledge_bases=None):
+        return self.db.max_marginal_relevance_search_by_vector(
+            embedding, k=k, fetch_k=fetch_k, filter=self.knowledge_base_filter(knowledge_bases)
+        )
+
+    def delete_knowledge_base(self, knowledge_base):
+        self.collection.delete(where={"knowledge_base": knowledge_base})
+
+    def persist(self):
+        pass  # A PersistentClient writes through
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors, quantization):
+    # Returns (codes, per-vector scales or None)
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(np.float32), None
+
+
+def dequantize(codes, scales=None):
+    vectors = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        vectors *= np.asarray(scales, dtype=np.float32)[:, None]
+    return vectors
+
+
+def maximal_marginal_relevance(query, candidates, k, lambda_mult=0.5):
+    # Indices into candidates, trading relevance to the query against similarity to what's already picked
+    if len(candidates) == 0:
+        return []
+    relevance = candidates @ query
+    selected = [int(np.argmax(relevance))]
+    max_similarity = candidates @ candidates[selected[0]]
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, candidates @ candidates[best])
+    return selected
+
+
+class RowFile:
+    # Append-only row-aligned matrix on disk, memory-mapped for reads
+    def __init__(self, path, dtype, width):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self._map = None
+
+    def row_count(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // (self.dtype.itemsize * self.width)
+
+    def size_bytes(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def rows(self):
+        # Only the rows a search touches are paged in
+        if self._map is None:
+            count = self.row_count()
+            self._map = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(count, self.width)) \
+                if count else np.zeros((0, self.width), dtype=self.dtype)
+        return self._map
+
+    def append(self, values):
+        with open(self.path, "ab") as f:
+            f.write(np.ascontiguousarray(values, dtype=self.dtype).reshape(-1, self.width).tobytes())
+        self._map = None
+
+    def rewrite(self, keep_rows, block_size=4096):
+        tmp_path = self.path + ".tmp"
+        rows = self.rows()
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(keep_rows), block_size):
+                f.write(np.ascontiguousarray(rows[keep_rows[start:start + block_size]]).tobytes())
+        self._map = None
+        os.replace(tmp_path, self.path)
+
+
+class MmapStore(VectorStore):
+    # Embeddings in flat memory-mapped files plus a SQLite sidecar for ids, text and metadata.
+    # Small KBs are searched exhaustively; large ones through an IVF (k-means) index.
+    # With float16 or int8 quantization the first pass scans the compact codes and the best
+    # candidates are rescored with the exact float32 vectors.
+    store_type = "mmap"
+    CHUNKS_FILENAME = "chunks.sqlite3"
+    IVF_FILENAME = "ivf.npz"
+    CODE_FILES = {"float16": ("vectors.f16", np.float16), "int8": ("vectors.i8", np.int8)}
+
+    def __init__(self, db_path, quantization="none", keep_exact=True, rescore_multiplier=4,
+                 ivf_threshold=20000, nprobe=8):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        os.makedirs(db_path, exist_ok=True)
+        self.db_path = db_path
+        self.ivf_file = os.path.join(db_path, self.IVF_FILENAME)
+        self.rescore_multiplier = rescore_multiplier
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(db_path, self.CHUNKS_FILENAME), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS store (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        if "knowledge_base" not in [column[1] for column in self.conn.execute("PRAGMA table_info(chunks)")]:
+            # Stores written before the unified index lack the column; their rows belong to a single KB
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN knowledge_base TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_knowledge_base ON chunks(knowledge_base)")
+        self.conn.commit()
+
+        # The file layout is fixed by the first write; stores written before quantization are plain float32
+        stored = dict(self.conn.execute("SELECT key, value FROM store"))
+        self.dim = int(stored["dim"]) if "dim" in stored else None
+        if self.dim is not None:
+            stored_quantization = stored.get("quantization", "none")
+            stored_keep_exact = stored.get("keep_exact", "1") == "1"
+            if (stored_quantization, stored_keep_exact) != (quantization, keep_exact or quantization == "none"):
+                logging.warning(f"{db_path} was written with quantization={stored_quantization}, "
+                                f"keep_exact={stored_keep_exact}; using that layout")
+            quantization, keep_exact = stored_quantization, stored_keep_exact
+        self.quantization = quantization
+        self.keep_exact = keep_exact or quantization == "none"
+        self.open_files()
+        self.reset_caches()
+
+    def open_files(self):
+        self.exact = self.codes = self.scales = None
+        if self.dim is None:
+            return
+        if self.keep_exact:
+            self.exact = RowFile(os.path.join(self.db_path, "vectors.f32"), np.float32, self.dim)
+        if self.quantization != "none":
+            filename, dtype = self.CODE_FILES[self.quantization]
+            self.codes = RowFile(os.path.join(self.db_path, filename), dtype, self.dim)
+        if self.quantization == "int8":
+            self.scales = RowFile(os.path.join(self.db_path, "scales.f32"), np.float32, 1)
+
+    def row_files(self):
+        return [row_file for row_file in (self.exact, self.codes, self.scales) if row_file is not None]
+
+    def reset_caches(self):
+        self._live_rows = {}  # {frozenset of KBs or None: sorted rows}
+        self._ivf = None
+
+    def row_count(self):
+        return (self.codes or self.exact).row_count() if self.dim is not None else 0
+
+    def size_bytes(self):
+        # (bytes scanned by the first pass, bytes of vectors on disk)
+        if self.dim is None:
+            return 0, 0
+        scanned = self.codes.size_bytes() + (self.scales.size_bytes() if self.scales else 0) \
+            if self.codes else self.exact.size_bytes()
+        return scanned, sum(row_file.size_bytes() for row_file in self.row_files())
+
+    def live_rows(self, knowledge_bases=None):
+        key = frozenset(knowledge_bases) if knowledge_bases is not None else None
+        if key not in self._live_rows:
+            if key is None:
+                cursor = self.conn.execute("SELECT row FROM chunks ORDER BY row")
+            else:
+                placeholders = ",".join("?" * len(key))
+                cursor = self.conn.execute(
+                    f"SELECT row FROM chunks WHERE knowledge_base IN ({placeholders}) ORDER BY row", list(key))
+            self._live_rows[key] = np.fromiter((row for (row,) in cursor), dtype=np.int64)
+        return self._live_rows[key]
+
+    def upsert(self, ids, texts, metadatas, embeddings):
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.conn.executemany("INSERT OR REPLACE INTO store (key, value) VALUES (?, ?)", [
+                    ("dim", str(self.dim)),
+                    ("quantization", self.quantization),
+                    ("keep_exact", "1" if self.keep_exact else "0"),
+                ])
+                self.open_files()
+            # Replaced chunks leave dead rows behind until the next compaction
+            self._delete(ids)
+            start = self.row_count()
+            if self.exact:
+                self.exact.append(vectors)
+            if self.codes:
+                codes, scales = quantize(vectors, self.quantization)
+                self.codes.append(codes)
+                if self.scales:
+                    self.scales.append(scales)
+            self.conn.executemany(
+                "INSERT INTO chunks (row, id, text, metadata, knowledge_base) VALUES (?, ?, ?, ?, ?)",
+                [(start + i, id_, text, json.dumps(metadata or {}), (metadata or {}).get("knowledge_base"))
+                 for i, (id_, text, metadata) in enumerate(zip(ids, texts, metadatas))],
+            )
+            self.conn.commit()
+            self.reset_caches()
+
+    def _delete(self, ids):
+        self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(id_,) for id_ in ids])
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self.lock:
+            self._delete(ids)
+            self.conn.commit()
+            self.reset_caches()
+
+    def delete_knowledge_base(self, knowledge_base):
+        with self.lock:
+            self.conn.execute("DELETE FROM chunks WHERE knowledge_base = ?", (knowledge_base,))
+            self.conn.commit()
+            self.reset_caches()
+
+    def fetch_rows(self, column, values):
+        found = {}
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for row, id_, text, metadata in self.conn.execute(
+                    f"SELECT row, id, text, metadata FROM chunks WHERE {column} IN ({placeholders})", batch):
+                found[row if column == "row" else id_] = (row, id_, text, json.loads(metadata))
+        return found
+
+    def get(self, ids=None, include_embeddings=False, knowledge_bases=None):
+        with self.lock:
+            if ids is None:
+                sql, params = "SELECT row, id, text, metadata FROM chunks", []
+                if knowledge_bases is not None:
+                    sql += f" WHERE knowledge_base IN ({','.join('?' * len(knowledge_bases))})"
+                    params = list(knowledge_bases)
+                records = [(row, id_, text, json.loads(metadata)) for row, id_, text, metadata in
+                           self.conn.execute(sql + " ORDER BY row", params)]
+            else:
+                found = self.fetch_rows("id", list(ids))
+                records = [found[id_] for id_ in ids if id_ in found]
+                if knowledge_bases is not None:
+                    records = [record for record in records if record[3].get("knowledge_base") in knowledge_bases]
+            result = {
+                "ids": [record[1] for record in records],
+                "documents": [record[2] for record in records],
+                "metadatas": [record[3] for record in records],
+            }
+            if include_embeddings:
+                rows = np.array([record[0] for record in records], dtype=np.int64)
+                result["embeddings"] = self.exact_vectors(rows) if len(rows) else []
+        return result
+
+    def approximate_vectors(self, rows):
+        if self.codes is None:
+            return np.asarray(self.exact.rows()[rows], dtype=np.float32)
+        return dequantize(self.codes.rows()[rows], self.scales.rows()[rows, 0] if self.scales else None)
+
+    def exact_vectors(self, rows):
+        return np.asarray(self.exact.rows()[rows], dtype=np.float32) if self.exact else self.approximate_vectors(rows)
+
+    def scan_scores(self, rows, query, block_size=16384):
+        # Scored in blocks so a large KB never gets dequantized into memory all at once
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            scores[start:start + len(block)] = self.approximate_vectors(block) @ query
+        return scores
+
+    def candidate_rows(self, query, knowledge_bases=None):
+        live_rows = self.live_rows(knowledge_bases)
+        ivf = self.load_ivf()
+        # A filter down to a few small KBs is cheaper to scan than to probe, and probing could miss them
+        if ivf is None or len(live_rows) < self.ivf_threshold:
+            return live_rows
+        centroids, list_rows, list_offsets, indexed_rows = ivf
+        # Probe the closest clusters, plus rows written since the index was built
+        probes = np.argsort(centroids @ query)[::-1][:self.nprobe]
+        probed = np.concatenate([list_rows[list_offsets[p]:list_offsets[p + 1]] for p in probes])
+        unindexed = live_rows[live_rows >= indexed_rows]
+        return np.concatenate([probed[np.isin(probed, live_rows)], unindexed])
+
+    def nearest_rows(self, query, k, knowledge_bases=None):
+        # Up to k rows best first and their exact scores
+        rows = np.sort(self.candidate_rows(query, knowledge_bases))
+        if len(rows) == 0:
+            return rows, np.zeros(0, dtype=np.float32)
+        scores = self.scan_scores(rows, query)
+        if self.codes is not None and self.exact is not None:
+            # Shortlist on the quantized scores, then rescore the shortlist exactly
+            shortlist = min(len(rows), k * self.rescore_multiplier)
+            top = np.argpartition(scores, -shortlist)[-shortlist:]
+            rows = np.sort(rows[top])
+            scores = self.exact_vectors(rows) @ query
+        top = np.argsort(scores)[::-1][:k]
+        return rows[top], scores[top]
+
+    def search_by_vector(self, embedding, k, fetch_k, knowledge_bases=None):
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self.lock:
+            if self.dim is None:
+                return []
+            rows, _ = self.nearest_rows(query, fetch_k, knowledge_bases)
+            if len(rows) == 0:
+                return []
+            chosen_rows = rows[maximal_marginal_relevance(query, self.exact_vectors(rows), k)]
+            found = self.fetch_rows("row", [int(row) for row in chosen_rows])
+        return [Document(page_content=found[int(row)][2], metadata=found[int(row)][3])
+                for row in chosen_rows if int(row) in found]
+
+    def load_ivf(self):
+        if self._ivf is None:
+            if not os.path.exists(self.ivf_file):
+                return None
+            data = np.load(self.ivf_file)
+            self._ivf = (data["centroids"], data["list_rows"], data["list_offsets"], int(data["indexed_rows"]))
+        return self._ivf
+
+    def compact(self):
+        # Rewrite the vector files without dead rows and renumber the sidecar to match
+        live_rows = self.live_rows()
+        for row_file in self.row_files():
+            row_file.rewrite(live_rows)
+        # Ascending order guarantees a new row number never collides with an unmoved one
+        self.conn.executemany("UPDATE chunks SET row = ? WHERE row = ?",
+                              [(new_row, int(old_row)) for new_row, old_row in enumerate(live_rows)])
+        self.conn.commit()
+        if os.path.exists(self.ivf_file):
+            os.remove(self.ivf_file)
+        self.reset_caches()
+
+    def build_ivf(self, iterations=10, sample_size=50000):
+        live_rows = self.live_rows()
+        n_lists = int(min(1024, max(8, np.sqrt(len(live_rows)))))
+        rng = np.random.default_rng(0)
+        sample = self.approximate_vectors(np.sort(rng.choice(live_rows, min(sample_size, len(live_rows)), replace=False)))
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            # Spherical k-means: assign by cosine, re-normalize the means
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = sample[assignments == list_id]
+                if len(members):
+                    centroids[list_id] = members.mean(axis=0)
+            centroids = normalize_rows(centroids)
+
+        assignments = np.empty(len(live_rows), dtype=np.int64)
+        for start in range(0, len(live_rows), 8192):
+            block = self.approximate_vectors(live_rows[start:start + 8192])
+            assignments[start:start + 8192] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        np.savez(self.ivf_file, centroids=centroids, list_rows=live_rows[order], list_offsets=list_offsets,
+                 indexed_rows=self.row_count())
+        self._ivf = None
+        logging.info(f"Built IVF index with {n_lists} lists over {len(live_rows)} vectors in {self.db_path}")
+
+    def persist(self):
+        with self.lock:
+            live = len(self.live_rows())
+            total = self.row_count()
+            if total and (total - live) > max(1000, total * 0.3):
+                self.compact()
+                total = self.row_count()
+            if live >= self.ivf_threshold:
+                ivf = self.load_ivf()
+                # Rebuild once a fifth of the vectors were written after the index was built
+                if ivf is None or (total - ivf[3]) > 0.2 * ivf[3]:
+                    self.build_ivf()
+            elif os.path.exists(self.ivf_file):
+                os.remove(self.ivf_file)
+                self._ivf = None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+            for row_file in self.row_files():
+                row_file._map = None
+
+
+class KnowledgeBaseView(VectorStore):
+    # One KB's slice of the unified index. Ids are prefixed with the KB name because the same URL
+    # (and so the same chunk id) can be ingested into several KBs
+    def __init__(self, store, knowledge_base):
+        self.store = store
+        self.knowledge_base = knowledge_base
+        self.store_type = store.store_type
+        self.prefix = f"{knowledge_base}/"
+
+    def upsert(self, ids, texts, metadatas, embeddings):
+        metadatas = [dict(metadata or {}, knowledge_base=self.knowledge_base) for metadata in metadatas]
+        self.store.upsert(unified_ids(self.knowledge_base, ids), texts, metadatas, embeddings)
+
+    def delete(self, ids):
+        self.store.delete(unified_ids(self.knowledge_base, ids))
+
+    def get(self, ids=None, include_embeddings=False, knowledge_bases=None):
+        result = self.store.get(ids=unified_ids(self.knowledge_base, ids) if ids is not None else None,
+                                include_embeddings=include_embeddings, knowledge_bases=[self.knowledge_base])
+        result["ids"] = [id_[len(self.prefix):] for id_ in result["ids"]]
+        return result
+
+    def search_by_vector(self, embedding, k, fetch_k, knowledge_bases=None):
+        return self.store.search_by_vector(embedding, k, fetch_k, knowledge_bases=[self.knowledge_base])
+
+    def delete_knowledge_base(self, knowledge_base):
+        self.store.delete_knowledge_base(self.knowledge_base)
+
+    def persist(self):
+        self.store.persist()
+
+
+def unified_ids(knowledge_base, ids):
+    return [f"{knowledge_base}/{id_}" for id_ in ids]
+
+
+def create_store(db_path, config, embedding_function):
+    if config["store"] == "chroma":
+        return ChromaStore(db_path, embedding_function)
+    if config["store"] == "mmap":
+        return MmapStore(
+            db_path,
+            quantization=config["quantization"],
+            keep_exact=MMAP_STORE_SETTINGS["keep_exact_vectors"],
+            rescore_multiplier=MMAP_STORE_SETTINGS["rescore_multiplier"],
+            ivf_threshold=MMAP_STORE_SETTINGS["ivf_threshold"],
+            nprobe=MMAP_STORE_SETTINGS["nprobe"],
+        )
+    raise ValueError(f"Unknown vector store '{config['store']}', expected one of {STORE_TYPES}")
+
+
+def unified_index_path():
+    return os.path.join(CHROMA_PATH, UNIFIED_INDEX_SETTINGS["directory"])
+
+
+_unified_store = None
+_unified_store_lock = threading.Lock()
+
+
+def open_unified_store(embedding_function):
+    # Every KB's chunks in one store, tagged with their knowledge_base. Ingestion and retrieval share
+    # the instance so writes reset the caches searches read from
+    global _unified_store
+    with _unified_store_lock:
+        if _unified_store is None:
+            _unified_store = create_store(unified_index_path(), UNIFIED_INDEX_SETTINGS, embedding_function)
+        return _unified_store
+
+
+def store_signature(config):
+    # Identifies the on-disk layout a KB's chunks are written to; a change means the KB must be re-ingested
+    if UNIFIED_INDEX_SETTINGS["enabled"]:
+        config = dict(UNIFIED_INDEX_SETTINGS, store=f"unified-{UNIFIED_INDEX_SETTINGS['store']}")
+    if config["store"].endswith("mmap") and config["quantization"] != "none":
+        return f"{config['store']}-{config['quantization']}"
+    return config["store"]
+
+
+_kb_stores = {}  # {knowledge_base: (store signature, VectorStore)}
+_kb_stores_lock = threading.Lock()
+
+
+def open_vector_store(knowledge_base, embedding_function, config=None):
+    # One instance per KB, shared by ingestion and retrieval like the unified store, so a compaction
+    # during ingestion resets the same caches and row mappings that searches read from
+    if UNIFIED_INDEX_SETTINGS["enabled"]:
+        return KnowledgeBaseView(open_unified_store(embedding_function), knowledge_base)
+    config = config or kb_registry.get(knowledge_base).config
+    signature = store_signature(config)
+    with _kb_stores_lock:
+        cached = _kb_stores.get(knowledge_base)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        store = create_store(os.path.join(CHROMA_PATH, knowledge_base), config, embedding_function)
+        _kb_stores[knowledge_base] = (signature, store)
+    if cached is not None:
+        cached[1].close()
+    return store
+
+
+def release_vector_store(knowledge_base):
+    # Closes the shared instance before its files are deleted
+    with _kb_stores_lock:
+        cached = _kb_stores.pop(knowledge_base, None)
+    if cached is not None:
+        cached[1].close()
@@ -29,7 +29,9 @@ You are capable of **any** task.
 
 SYSTEM_MESSAGE_REFERENCING_SEARCHING = '''
 ### Referencing and Searching:
-- If you need to refer to prior interactions, access the "conversation_history" folder.
+- If you need to refer to prior interactions, search them instead of reading files:
+  `import sys; sys.path.insert(0, "src"); from Core.history_store import search_history; print(search_history("your query"))`
+  Each result has the conversation_id, timestamp, role and a snippet of the matching message.
 - To search the Web use computer.browser.search(query)
 '''
 
@@ -65,6 +67,147 @@ TTS_SETTINGS = {
 CHROMA_PATH = "src/Databases"
 KB_PATH = "Knowledge"
 
+# Skill settings: the skills most relevant to each query are inlined into the prompt
+SKILL_SETTINGS = {
+    "top_k": 3,
+    "min_similarity": 0.78,  # Cosine similarity between the query and the skill
+    "max_skill_tokens": 1200  # Longer skills are referenced by path instead of inlined
+}
+
+# Conversation compaction settings: older turns are summarized once the history passes threshold_tokens
+CONVERSATION_COMPACTION_SETTINGS = {
+    "enabled": True,
+    "threshold_tokens": 6000,  # Keep well under INTERPRETER_SETTINGS["context_window"]
+    "keep_recent_tokens": 2500,  # Most recent turns kept verbatim
+    "summary_model": "gpt-4o-mini",
+    "summary_max_tokens": 500
+}
+
+# Conversation history store: append-only log plus full-text index in the conversation history folder
+HISTORY_SETTINGS = {
+    "path": "conversation_history",  # Existing Context_*.json files here are imported once
+    "flush_interval": 1.0,  # Seconds the background writer waits to batch records
+    "batch_size": 200
+}
+
+# Session pool settings, for serving several independent conversations from one process
+SESSION_POOL_SETTINGS = {
+    "max_sessions": 4,  # Each session has its own interpreter and code subprocesses
+    "idle_timeout": 1800,  # Seconds before an idle session is closed
+    "reap_interval": 60  # Seconds between idle checks
+}
+
+# Headless server settings (src/server.py)
+SERVER_SETTINGS = {
+    "host": "127.0.0.1",  # Use 0.0.0.0 to accept connections from other devices
+    "port": 8765,
+    "api_token": "",  # Required as a Bearer token when set; HUMANSCRIPT_API_TOKEN overrides it
+    "max_buffered_chunks": 64,  # Unread chunks per turn before the stream waits for the client
+    "default_kbs": []  # Knowledge bases selected for new sessions that don't choose their own
+}
+
+# Request scheduler settings
+REQUEST_SCHEDULER_SETTINGS = {
+    "max_queue": 3,  # Turns that can wait behind the running one in a session; more are rejected
+    "preempt": True  # New input cancels the running turn and anything queued instead of waiting
+}
+
+# KB registry settings
+KB_REGISTRY_SETTINGS = {
+    "check_interval": 2.0  # Seconds between mtime checks of a KB's instructions, skills, config and index
+}
+
+# Ingestion settings
+INGESTION_SETTINGS = {
+    "loader_workers": None,  # None uses one process per CPU core
+    "batch_size": 64,  # Chunks embedded and upserted per batch
+    "queue_size": 256  # Max chunks waiting between the split and embed stages
+}
+
+# URL fetching settings
+URL_FETCH_SETTINGS = {
+    "cache_path": "src/Databases/url_cache",
+    "max_workers": 8,
+    "per_host_limit": 2,
+    "timeout": 15
+}
+
+# Retrieval settings
+RETRIEVAL_SETTINGS = {
+    "k": 5,
+    "fetch_k": 25,
+    "candidate_k": 10,  # Vector and BM25 hits fused per knowledge base before keeping the top k
+    "hybrid": True,  # Fuse BM25 keyword hits with vector hits
+    "rrf_k": 60,  # Reciprocal rank fusion constant
+    "top_n": 10,  # Documents kept across all selected knowledge bases
+    "compression_model": "gpt-4o-mini",
+    "max_open_kbs": 8,  # Knowledge bases kept open in the retriever registry
+    "max_parallel_kbs": 8,  # Knowledge bases searched concurrently
+    "deadline_seconds": 8.0  # Overall retrieval deadline across all selected knowledge bases
+}
+
+# Token budget for retrieved chunks and skills added to each prompt; KB instructions go in the system message
+CONTEXT_PACKING_SETTINGS = {
+    "budget_tokens": 3000
+}
+
+# Speculative retrieval while the user is typing or speaking
+PREFETCH_SETTINGS = {
+    "enabled": True,
+    "debounce_seconds": 0.6,  # Pause in typing before prefetching
+    "similarity_threshold": 0.9,  # Min cosine similarity between the prefetched and final query
+    "min_chars": 12,
+    "wait_seconds": 2.0,  # How long the final query waits for an in-flight prefetch
+    "voice_draft_transcript": True  # Prefetch from a quick draft transcript while Whisper runs
+}
+
+# Semantic cache for retrieval results of repeated questions
+SEMANTIC_CACHE_SETTINGS = {
+    "enabled": True,
+    # Cosine similarity between query embeddings. ada-002 scores cluster high: "turn on X" and "turn off X"
+    # usually pass 0.95, so only near-verbatim repeats should hit
+    "similarity_threshold": 0.98,
+    "ttl_seconds": 600,
+    "capacity": 256
+}
+
+# Per knowledge base defaults, overridden by Knowledge/<kb>/config.json
+DEFAULT_KB_CONFIG = {
+    "compression": "local",  # "off", "local" (extractive, no LLM calls) or "llm" (LLMChainExtractor)
+    "store": "chroma",  # "chroma" or "mmap" (memory-mapped flat/IVF vectors, opens without a database server)
+    "quantization": "none"  # mmap store only: "none", "float16" (2x smaller scans) or "int8" (4x)
+}
+
+# Memory-mapped vector store settings
+MMAP_STORE_SETTINGS = {
+    "ivf_threshold": 20000,  # Below this many chunks search is exhaustive
+    "nprobe": 8,  # IVF lists scanned per query
+    "rescore_multiplier": 4,  # Quantized KBs rescore fetch_k * this many candidates with exact vectors
+    # Quantized KBs keep a memory-mapped float32 copy that only the rescored shortlist is read from, so recall
+    # stays at float32 levels and scans shrink, but disk use grows. False also shrinks disk, at quantized
+    # recall (about 0.97 recall@10 for int8 in benchmarks/quantization_benchmark.py). Existing KBs keep the
+    # layout they were built with
+    "keep_exact_vectors": True
+}
+
+# Unified index: every KB's chunks in one store, selected KBs become a metadata filter on a single search.
+# Manifests and BM25 indexes stay per KB; toggling this re-ingests each KB on its next refresh.
+UNIFIED_INDEX_SETTINGS = {
+    "enabled": False,
+    "directory": "_unified",  # Under CHROMA_PATH
+    "store": "mmap",  # "chroma" or "mmap"
+    "quantization": "none"
+}
+
+# Embedding cache settings
+EMBEDDING_CACHE_SETTINGS = {
+    "model": "text-embedding-ada-002",
+    "path": "src/Databases/embedding_cache.sqlite3",
+    "max_size_mb": 512,
+    "batch_size": 256,
+    "query_cache_size": 256  # Recent query embeddings kept in memory
+}
+
 # Default selected knowledge bases
 DEFAULT_SELECTED_KBS = []
 
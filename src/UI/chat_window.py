@@ -2,21 +2,24 @@ import customtkinter as ctk
 import os
 import threading
 import logging
-from datetime import datetime
 from Settings.config import *
 from Core.chat_manager import ChatManager
 from Core.audio_manager import AudioManager
 from Core.knowledge_manager import KnowledgeManager
+from Core.ingestion_jobs import IngestionJobQueue
 from Core.context_manager import ContextManager
 from Core.interpreter_manager import InterpreterManager
+from Core.request_scheduler import RequestScheduler
 from interpreter import interpreter
 from UI.settings_window import SettingsWindow
 from Settings.color_settings import *
 import re
 from collections import OrderedDict, deque
 
+UI_SESSION_ID = "ui"
+
 class ChatUI:
-  def __init__(self, root):
+  def __init__(self, root, interpreter_manager=None):
     self.root = root
     self.root.title("HumanScript Chat")
 
@@ -33,9 +36,17 @@ class ChatUI:
 
     # Initialize KnowledgeManager first
     self.knowledge_manager = KnowledgeManager(self)
-    self.interpreter_manager = InterpreterManager(self.knowledge_manager)
+    self.ingestion_jobs = IngestionJobQueue(self.knowledge_manager)
+    # Reuse the manager that configured the provider: each one has a PromptBuilder writing system_message
+    self.interpreter_manager = interpreter_manager or InterpreterManager(self.knowledge_manager)
     self.chat_manager = ChatManager(self.interpreter_manager, self)
     self.audio_manager = AudioManager()
+    # One turn at a time against the shared interpreter; new input preempts the running turn
+    self.request_scheduler = RequestScheduler(
+      self.process_response,
+      max_queue=REQUEST_SCHEDULER_SETTINGS["max_queue"],
+      preempt=REQUEST_SCHEDULER_SETTINGS["preempt"]
+    )
 
     self.context_manager = ContextManager(self)
 
@@ -67,6 +78,7 @@ class ChatUI:
     self.create_input_area(self.main_frame)
 
     self.root.bind('<Return>', self.send_message)
+    self.root.bind('<Escape>', self.stop_response)
 
   def create_sidebar(self):
     # Knowledge base section
@@ -76,11 +88,7 @@ class ChatUI:
     self.kb_frame = ctk.CTkScrollableFrame(self.sidebar, fg_color="transparent")
     self.kb_frame.pack(padx=20, pady=(0, 20), fill="both", expand=True)
 
-    self.kb_toggles = {}
-    for kb in self.knowledge_manager.get_knowledge_bases():
-      toggle = ctk.CTkCheckBox(self.kb_frame, text=kb, command=lambda kb=kb: self.toggle_kb(kb))
-      toggle.pack(anchor="w", pady=2)
-      self.kb_toggles[kb] = toggle
+    self.add_kb_toggles()
 
     # Add settings icon to the sidebar
     settings_icon = ctk.CTkButton(
@@ -96,17 +104,23 @@ class ChatUI:
     )
     settings_icon.pack(pady=10, padx=20, fill="x")
 
+  def add_kb_toggles(self):
+    # KB names and stats come from the KB registry, so rebuilding the sidebar doesn't rescan the folders
+    self.kb_toggles = {}
+    for kb in self.knowledge_manager.get_knowledge_bases():
+      info = self.knowledge_manager.get_kb_info(kb)
+      label = f"{kb} ({info.doc_count} docs)" if info.indexed else kb
+      toggle = ctk.CTkCheckBox(self.kb_frame, text=label, command=lambda kb=kb: self.toggle_kb(kb))
+      toggle.pack(anchor="w", pady=2)
+      self.kb_toggles[kb] = toggle
+
   def refresh_knowledge_bases(self):
     # Clear the current knowledge base toggles
     for widget in self.kb_frame.winfo_children():
       widget.destroy()
 
     # Recreate the knowledge base toggles
-    self.kb_toggles = {}
-    for kb in self.knowledge_manager.get_knowledge_bases():
-      toggle = ctk.CTkCheckBox(self.kb_frame, text=kb, command=lambda kb=kb: self.toggle_kb(kb))
-      toggle.pack(anchor="w", pady=2)
-      self.kb_toggles[kb] = toggle
+    self.add_kb_toggles()
 
     # Refresh the toggles based on the current selection
     self.refresh_kb_toggles()
@@ -199,6 +213,7 @@ class ChatUI:
 
     self.input_box = ctk.CTkTextbox(input_frame, height=50, fg_color=get_color("BG_INPUT"), text_color=get_color("TEXT_PRIMARY"))
     self.input_box.grid(row=0, column=0, sticky="ew", padx=(0, 5))
+    self.input_box.bind("<KeyRelease>", self.prefetch_retrieval)
 
     # Use Unicode microphone character
     self.mode_button = ctk.CTkButton(input_frame, text="🎤", width=50, height=50, command=self.toggle_mode, 
@@ -207,6 +222,14 @@ class ChatUI:
                                      font=("Helvetica", 16))
     self.mode_button.grid(row=0, column=1)
 
+  def prefetch_retrieval(self, event=None):
+    # Debounced inside the prefetcher, so this is cheap to call on every keystroke
+    if not self.is_voice_mode:
+      self.chat_manager.prefetcher.update(self.input_box.get("1.0", ctk.END), self.selected_kbs)
+
+  def prefetch_retrieval_immediately(self, partial_text):
+    self.chat_manager.prefetcher.update(partial_text, self.selected_kbs, immediate=True)
+
   def toggle_mode(self):
     self.is_voice_mode = not self.is_voice_mode
     if self.is_voice_mode:
@@ -230,7 +253,7 @@ class ChatUI:
         logging.error(f"Error in continuous listening: {str(e)}")
 
   def process_speech_input(self):
-    user_input = self.audio_manager.recognize_speech()
+    user_input = self.audio_manager.recognize_speech(on_partial_transcript=self.prefetch_retrieval_immediately)
     if user_input and not user_input.startswith("Error"):
       self.send_message(user_input=user_input)
 
@@ -252,7 +275,6 @@ class ChatUI:
       self.selected_kbs.append(kb)
     elif not is_active and kb in self.selected_kbs:
       self.selected_kbs.remove(kb)
-      self.context_manager.clear_custom_instructions()  # Clear custom instructions when KB is turned off
     
     self.knowledge_manager.update_selected_kbs(self.selected_kbs)
     self.refresh_kb_toggles()
@@ -263,11 +285,6 @@ class ChatUI:
     # After toggling, refresh the system message with updated skills
     self.chat_manager.update_selected_kbs(self.selected_kbs)
 
-  
-  def sanitize_filename(self, filename: str) -> str:
-    # Implement filename sanitization logic here
-    sanitized = ''.join(c for c in filename if c.isalnum() or c in (' ', '.', '_')).rstrip()
-    return sanitized
 
   def send_message(self, user_input=None):
     if not self.is_voice_mode:
@@ -276,19 +293,19 @@ class ChatUI:
     if user_input:
       self.create_chat_bubble(f"{user_input}", is_user=True)
       self.input_box.delete("1.0", ctk.END)
-      # Modify the filename generation for the interpreter
-      timestamp = datetime.now().strftime("%Y_%m_%d_%H-%M-%S")
-      sanitized_query = self.sanitize_filename(user_input[:50])  # Limit to first 50 characters
-      filename = f"Context_{sanitized_query}_{timestamp}.json"
-          
-      # Set the custom filename for the interpreter
-      interpreter.conversation_filename = filename
-      
-      # Start a new thread for processing the response
-      threading.Thread(target=self.process_response, args=(user_input,), daemon=True).start()
-      
-  def process_response(self, user_input):
-    response_generator, sources = self.chat_manager.process_input(user_input, self.selected_kbs)
+
+      request = self.request_scheduler.submit(UI_SESSION_ID, user_input)
+      if request.status == "rejected":
+        self.create_chat_bubble("Still working on earlier messages, please wait.", is_user=False)
+
+  def stop_response(self, event=None):
+    self.request_scheduler.cancel(UI_SESSION_ID, reason="stopped")
+
+  def process_response(self, request):
+    # Runs on the scheduler's worker thread for the UI session
+    request.add_cancel_callback(lambda request: self.chat_manager.stop_running_code())
+    response_generator, sources = self.chat_manager.process_input(request.user_input, self.selected_kbs,
+                                                                   request.cancel_event)
     
     # Add indicator for knowledge base query
     if self.selected_kbs:
@@ -308,6 +325,12 @@ class ChatUI:
       self.streaming_label.destroy()
       self.streaming_label = None
 
+    if request.cancelled:
+      if request.cancel_reason != "reset":
+        self.create_chat_bubble(f"Response {request.cancel_reason}.", is_user=False)
+      print(f"Request scheduler: {self.request_scheduler.stats()}")
+      return
+
     # Get the final response from the last message if the role is "assistant" otherwise return "no response"
     if interpreter.messages and interpreter.messages[-1]['role'] == 'assistant':
       final_response = interpreter.messages[-1]['content']
@@ -323,13 +346,19 @@ class ChatUI:
     
     if self.is_voice_mode:
       threading.Thread(target=self.audio_manager.text_to_speech, args=(final_response,), daemon=True).start()
+    print(f"Request scheduler: {self.request_scheduler.stats()}")
 
   def reset_chat(self):
-    interpreter.reset()
+    # The interrupted turn keeps writing to the interpreter until it stops, so reset after it has
+    self.request_scheduler.interrupt(UI_SESSION_ID, "reset", self.reset_conversation)
     for widget in self.message_frame.winfo_children():
       widget.destroy()
     self.streaming_label = None
 
+  def reset_conversation(self):
+    interpreter.reset()
+    self.chat_manager.reset_conversation()
+
   def open_settings(self):
     # Clear the main frame and display settings
     for widget in self.main_frame.winfo_children():
@@ -357,15 +386,7 @@ class ChatUI:
           os.environ[key] = value
       
       # Update system message
-      custom_env_vars = sorted(set(key for key in self.env_vars.keys() if key.startswith("CUSTOM_")))
-      env_var_message = "\n- ".join(custom_env_vars)
-      
-      interpreter.system_message = (
-          f"{SYSTEM_MESSAGE}\n"
-          f"{SYSTEM_MESSAGE_ENV_VARS}\n"
-          f"\n- {env_var_message}"
-      )
-      print(interpreter.system_message)
+      self.interpreter_manager.update_env_vars(self.env_vars)
       
       # Update ChatManager
       self.chat_manager.update_env_vars(self.env_vars)
@@ -2,6 +2,7 @@ import customtkinter as ctk
 from tkinter import messagebox
 import json
 import os
+from Core.provider_config import PROVIDER_CONFIG_PATH
 
 class ProviderSelectionUI:
   def __init__(self, root):
@@ -80,7 +81,7 @@ class ProviderSelectionUI:
 
   def load_from_file(self):
     try:
-      with open('src/Settings/provider_config.json', 'r') as f:
+      with open(PROVIDER_CONFIG_PATH, 'r') as f:
         saved_config = json.load(f)
       
       for key, entry in self.credential_entries.items():
@@ -3,7 +3,6 @@ from tkinter import messagebox, simpledialog, filedialog
 from Settings.config import INTERPRETER_SETTINGS, CHROMA_PATH, KB_PATH
 import json
 import os
-import shutil
 from interpreter import interpreter
 import importlib
 from Settings.color_settings import *
@@ -15,8 +14,10 @@ class SettingsWindow:
     self.selected_files = []
     self.selected_urls = []
     self.selected_kb = ctk.StringVar()
+    self.finished_job_ids = {job.id for job in self.chat_ui.ingestion_jobs.jobs() if job.is_finished}
     self.create_widgets()
     self.load_current_settings()
+    self.poll_ingestion_jobs()
 
   def create_widgets(self):
     # Create a scrollable frame for settings
@@ -143,6 +144,11 @@ class SettingsWindow:
 
     ctk.CTkButton(parent, text="Refresh Selected Knowledge Base", command=self.refresh_selected_kb, fg_color=get_color("BG_INPUT"), text_color=get_color("TEXT_PRIMARY"), hover_color=get_color("BG_SECONDARY")).pack(pady=(10, 5), anchor="w")
 
+    ctk.CTkLabel(parent, text="Ingestion Jobs:", text_color=get_color("TEXT_PRIMARY")).pack(pady=(10, 5), anchor="w")
+    self.jobs_display = ctk.CTkTextbox(parent, height=100, fg_color=get_color("BG_INPUT"), text_color=get_color("TEXT_PRIMARY"))
+    self.jobs_display.pack(pady=5, fill="x", expand=True)
+    ctk.CTkButton(parent, text="Cancel Running Jobs", command=self.cancel_jobs, fg_color=get_color("BG_INPUT"), text_color=get_color("TEXT_PRIMARY"), hover_color=get_color("BG_SECONDARY")).pack(pady=5, anchor="w")
+
   def clear_queue(self):
     self.selected_files.clear()
     self.selected_urls.clear()
@@ -177,25 +183,14 @@ class SettingsWindow:
         messagebox.showerror("Error", "Please enter a name for the new knowledge base.")
         return
 
-    kb_path = os.path.join(KB_PATH, kb_name)
-    os.makedirs(kb_path, exist_ok=True)
-
-    docs_path = os.path.join(kb_path, "docs")
-    os.makedirs(docs_path, exist_ok=True)
-
-    urls_path = os.path.join(kb_path, "urls.txt")
-
-    for file_path in self.selected_files:
-      shutil.copy(file_path, docs_path)
-
-    with open(urls_path, "a") as f:
-      for url in self.selected_urls:
-        f.write(url + "\n")
+    # Copying runs on the ingestion worker so large files don't freeze the UI
+    self.chat_ui.ingestion_jobs.submit_add(kb_name, files=self.selected_files, urls=self.selected_urls)
 
     self.selected_files.clear()
     self.selected_urls.clear()
     self.update_queue_display()
-    messagebox.showinfo("Knowledge Base Updated", f"Files and URLs have been added to {kb_name}.")
+    self.update_jobs_display()
+    messagebox.showinfo("Knowledge Base Update Queued", f"Files and URLs are being added to {kb_name}.")
 
   def refresh_selected_kb(self):
     selected_kb = self.kb_dropdown.get()
@@ -203,12 +198,34 @@ class SettingsWindow:
       messagebox.showwarning("Invalid Selection", "Please select an existing knowledge base to refresh.")
       return
 
-    try:
-      self.chat_ui.knowledge_manager.build_vector_database(selected_kb)
+    self.chat_ui.ingestion_jobs.submit_refresh(selected_kb)
+    self.update_jobs_display()
+
+  def cancel_jobs(self):
+    for job in self.chat_ui.ingestion_jobs.active_jobs():
+      job.cancel()
+    self.update_jobs_display()
+
+  def update_jobs_display(self):
+    self.jobs_display.delete("1.0", ctk.END)
+    for job in reversed(self.chat_ui.ingestion_jobs.jobs()):
+      self.jobs_display.insert(ctk.END, job.describe() + "\n")
+
+  def poll_ingestion_jobs(self):
+    # Jobs run on worker threads; the settings panel only reads their status from the Tk loop
+    if not self.jobs_display.winfo_exists():
+      return
+    self.update_jobs_display()
+    newly_finished = [job for job in self.chat_ui.ingestion_jobs.jobs()
+                      if job.is_finished and job.id not in self.finished_job_ids]
+    if newly_finished:
+      self.finished_job_ids.update(job.id for job in newly_finished)
+      self.kb_dropdown.configure(values=self.chat_ui.knowledge_manager.get_knowledge_bases() + ["New Knowledge Base"])
       self.chat_ui.refresh_knowledge_bases()  # Update the UI
-      messagebox.showinfo("Knowledge Base Refreshed", f"The knowledge base '{selected_kb}' has been refreshed.")
-    except Exception as e:
-      messagebox.showerror("Error", f"An error occurred while refreshing the knowledge base: {str(e)}")
+      for job in newly_finished:
+        if job.status == "failed":
+          messagebox.showerror("Error", f"An error occurred while updating the knowledge base '{job.knowledge_base}': {job.error}")
+    self.parent.after(500, self.poll_ingestion_jobs)
 
   def load_current_settings(self):
     self.wake_word_entry.insert(0, self.chat_ui.wake_word)
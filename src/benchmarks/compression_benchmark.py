@@ -0,0 +1,66 @@
+# Compares latency and context size of the "off", "local" and "llm" compressors.
+# Run from the repository root, like main.py:
+#   python src/benchmarks/compression_benchmark.py --kb MyKB "how do I reset the device" "what is the wake word"
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from Settings.config import RETRIEVAL_SETTINGS
+from Core.context_compressors import COMPRESSION_MODES, create_compressor
+from Core.embedding_cache import get_embedding_function
+from Core.retriever_registry import retriever_registry
+
+
+def count_tokens(text):
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except ImportError:
+        return len(text) // 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark context compressors against a knowledge base")
+    parser.add_argument("--kb", required=True, action="append", help="Knowledge base to query (repeatable)")
+    parser.add_argument("queries", nargs="+", help="Queries to run")
+    args = parser.parse_args()
+
+    load_dotenv()
+    embedding_function = get_embedding_function()
+    compressors = {mode: create_compressor(mode, retriever_registry.get_llm) for mode in COMPRESSION_MODES}
+    totals = {mode: {"seconds": 0.0, "chars": 0, "tokens": 0, "docs": 0} for mode in COMPRESSION_MODES}
+
+    for query in args.queries:
+        query_embedding = embedding_function.embed_query(query)
+        # Every compressor sees exactly the same retrieved documents
+        docs = []
+        for kb in args.kb:
+            with retriever_registry.checkout(kb) as entry:
+                docs.extend(entry.db.search_by_vector(
+                    query_embedding, k=RETRIEVAL_SETTINGS["k"], fetch_k=RETRIEVAL_SETTINGS["fetch_k"]
+                ))
+        for mode, compressor in compressors.items():
+            start = time.perf_counter()
+            compressed = compressor.compress(docs, query, query_embedding)
+            elapsed = time.perf_counter() - start
+            context = "\n\n".join(doc.page_content for doc in compressed)
+            totals[mode]["seconds"] += elapsed
+            totals[mode]["chars"] += len(context)
+            totals[mode]["tokens"] += count_tokens(context)
+            totals[mode]["docs"] += len(compressed)
+            print(f"{mode:>5}  {elapsed * 1000:9.1f} ms  {len(compressed):3d} docs  {count_tokens(context):6d} tokens  {query}")
+
+    count = len(args.queries)
+    print("\nAverages per query:")
+    print(f"{'mode':>5}  {'latency':>12}  {'docs':>5}  {'chars':>8}  {'tokens':>7}")
+    for mode, total in totals.items():
+        print(f"{mode:>5}  {total['seconds'] / count * 1000:9.1f} ms  {total['docs'] / count:5.1f}  "
+              f"{total['chars'] / count:8.0f}  {total['tokens'] / count:7.0f}")
+
+
+if __name__ == "__main__":
+    main()
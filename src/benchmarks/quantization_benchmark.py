@@ -0,0 +1,102 @@
+# Measures recall@10, query latency and vector footprint of the mmap store for each quantization.
+# Run from the repository root, like main.py:
+#   python src/benchmarks/quantization_benchmark.py --kb MyKB
+#   python src/benchmarks/quantization_benchmark.py --synthetic 20000
+# Exits with status 1 if a configuration the store can run with the configured keep_exact_vectors recalls
+# less than --min-recall; the others are reported for comparison.
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from dotenv import load_dotenv
+from Settings.config import MMAP_STORE_SETTINGS
+from Core.vector_stores import QUANTIZATIONS, MmapStore, normalize_rows, open_vector_store
+
+
+def load_kb_vectors(knowledge_base):
+    from Core.embedding_cache import get_embedding_function
+    store = open_vector_store(knowledge_base, get_embedding_function())
+    return np.asarray(store.get(include_embeddings=True)["embeddings"], dtype=np.float32)
+
+
+def synthetic_vectors(count, dim, clusters=200, seed=0):
+    # Clustered like real embeddings, so near neighbours are close together and hard to tell apart
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=count)] + 0.35 * rng.normal(size=(count, dim))).astype(np.float32)
+
+
+def build_store(path, corpus, quantization, keep_exact, batch_size=1024):
+    # IVF stays off so recall reflects quantization alone
+    store = MmapStore(path, quantization=quantization, keep_exact=keep_exact,
+                      rescore_multiplier=MMAP_STORE_SETTINGS["rescore_multiplier"], ivf_threshold=len(corpus) + 1)
+    for start in range(0, len(corpus), batch_size):
+        batch = corpus[start:start + batch_size]
+        ids = [str(start + i) for i in range(len(batch))]
+        store.upsert(ids, ids, [{}] * len(batch), batch)
+    store.persist()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall@k of quantized vector storage")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--kb", help="Use the stored embeddings of this knowledge base as the corpus")
+    source.add_argument("--synthetic", type=int, help="Use this many synthetic clustered vectors")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=100, help="Corpus vectors held out as queries")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--min-recall", type=float, default=0.99,
+                        help="Fail if a configuration with the configured exact rescoring recalls less")
+    args = parser.parse_args()
+
+    load_dotenv()
+    vectors = load_kb_vectors(args.kb) if args.kb else synthetic_vectors(args.synthetic, args.dim)
+    vectors = normalize_rows(vectors)
+    rng = np.random.default_rng(1)
+    held_out = rng.permutation(len(vectors))
+    queries, corpus = vectors[held_out[:args.queries]], vectors[held_out[args.queries:]]
+    print(f"{len(corpus)} vectors of dimension {corpus.shape[1]}, {len(queries)} queries, recall@{args.k}")
+
+    # Exact float32 brute force is the ground truth
+    truth = [set(np.argsort(corpus @ query)[::-1][:args.k]) for query in queries]
+
+    configurations = [("none", True)] + [(quantization, keep_exact) for quantization in QUANTIZATIONS[1:]
+                                         for keep_exact in (True, False)]
+    print(f"{'quantization':<14}{'rescore':<10}{'recall':>8}{'ms/query':>10}{'scanned MB':>12}{'disk MB':>10}")
+    below_minimum = []
+    for quantization, keep_exact in configurations:
+        path = tempfile.mkdtemp(prefix="quantization_benchmark_")
+        try:
+            store = build_store(path, corpus, quantization, keep_exact)
+            hits = 0
+            start = time.perf_counter()
+            for query, expected in zip(queries, truth):
+                rows, _ = store.nearest_rows(query, args.k)
+                hits += len(expected.intersection(int(row) for row in rows))
+            elapsed = time.perf_counter() - start
+            scanned, on_disk = store.size_bytes()
+            rescore = "exact" if keep_exact and quantization != "none" else "-"
+            recall = hits / (args.k * len(queries))
+            print(f"{quantization:<14}{rescore:<10}{recall:>8.3f}"
+                  f"{1000 * elapsed / len(queries):>10.2f}{scanned / 2**20:>12.1f}{on_disk / 2**20:>10.1f}")
+            checked = quantization == "none" or keep_exact == MMAP_STORE_SETTINGS["keep_exact_vectors"]
+            if checked and recall < args.min_recall:
+                below_minimum.append(f"{quantization} ({rescore} rescore): {recall:.3f}")
+            store.close()
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    if below_minimum:
+        print(f"Recall below {args.min_recall}: {', '.join(below_minimum)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import logging
+import os
+from aiohttp import web
+from Settings.config import SERVER_SETTINGS
+from Core.chat_server import ChatServer
+from Core.interpreter_manager import InterpreterManager
+from Core.knowledge_manager import KnowledgeManager
+from Core.provider_config import load_provider_config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def main():
+    # Headless entry point: no Tk display or provider dialog, just the chat API
+    parser = argparse.ArgumentParser(description="Run HumanScript as a headless chat server.")
+    parser.add_argument("--host", default=SERVER_SETTINGS["host"])
+    parser.add_argument("--port", type=int, default=SERVER_SETTINGS["port"])
+    parser.add_argument("--provider-config", help="JSON file with the provider credentials "
+                                                  "(default: src/Settings/provider_config.json); "
+                                                  "environment variables override it")
+    parser.add_argument("--kbs", nargs="*", help="Knowledge bases selected for new sessions")
+    args = parser.parse_args()
+
+    provider, config = load_provider_config(args.provider_config)
+    knowledge_manager = KnowledgeManager(None)
+    # Sessions copy their provider settings from the module-level interpreter configured here
+    InterpreterManager(knowledge_manager).apply_provider(provider, config)
+    print(f"Using provider {provider}")
+
+    server = ChatServer(
+        knowledge_manager,
+        default_kbs=args.kbs,
+        api_token=os.environ.get("HUMANSCRIPT_API_TOKEN") or SERVER_SETTINGS["api_token"]
+    )
+    if args.host not in ("127.0.0.1", "localhost") and not server.api_token:
+        logging.warning("Listening beyond localhost without an API token; set HUMANSCRIPT_API_TOKEN")
+    web.run_app(server.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()